@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import checks, metrics, profiling, signals  # noqa: F401
+        if settings.METRICS_ENABLED:
+            metrics.install()
+        if settings.PROFILING_ENABLED:
+            profiling.install()
@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from .profiling import thread_scope
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Горячие маршруты чтения, которые в режиме ASGI обслуживаются асинхронно.
+ASYNC_READ_ROUTES = (
+    'recipes-list', 'recipes-detail',
+    'ingredients-list', 'ingredients-detail',
+    'tags-list', 'tags-detail',
+)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_THREADS,
+    thread_name_prefix='api-read',
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    """
+    Выполняет представление в потоке пула. У каждого потока свое
+    соединение с базой, поэтому оно закрывается по тем же правилам,
+    что и в начале и конце обычного запроса.
+    """
+    close_old_connections()
+    try:
+        with thread_scope():
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """
+    Асинхронная обертка синхронного представления.
+
+    Под ASGI Django выполняет синхронные представления по очереди
+    в одном общем потоке. Запросы на чтение обертка отдает пулу из
+    ASYNC_READ_THREADS потоков, запись идет прежним путем.
+    """
+    write_view = sync_to_async(view, thread_sensitive=True)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await write_view(request, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, contextvars.copy_context().run,
+            partial(run_view, view, request, *args, **kwargs),
+        )
+
+    return wrapper
+
+
+def async_read_patterns(patterns, names=ASYNC_READ_ROUTES):
+    """Копия urlpatterns, где маршруты names обернуты async_read_view."""
+    return [
+        URLPattern(
+            pattern.pattern, async_read_view(pattern.callback),
+            pattern.default_args, pattern.name,
+        )
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
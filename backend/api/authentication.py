@@ -0,0 +1,113 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Соответствие токен → пользователь без запроса к authtoken_token.
+
+    Первый уровень — LRU в памяти процесса на TOKEN_CACHE_SIZE записей
+    с временем жизни TOKEN_CACHE_TTL, второй (TOKEN_CACHE_SHARED) — кеш
+    Django. Обе записи привязаны к общей версии в кеше Django: выход,
+    удаление токена и изменение пользователя увеличивают версию, и каждый
+    процесс сбрасывает свои записи при следующем запросе.
+    """
+
+    version_key = 'auth-token:version'
+    shared_key = 'auth-token:{}:{}'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.version = None
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+    def get(self, key):
+        """
+        Токен с пользователем и версия, под которой его сохранять.
+        Каждый запрос получает свою копию, общий объект не меняется.
+        """
+        version = self.get_version()
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is not None:
+                token, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    return copy.deepcopy(token), version
+                del self.entries[key]
+        if settings.TOKEN_CACHE_SHARED:
+            token = cache.get(self.shared_key.format(version, digest(key)))
+            if token is not None:
+                self.store(key, token, version, shared=False)
+                return token, version
+        return None, version
+
+    def set(self, key, token, version):
+        self.store(key, token, version, shared=settings.TOKEN_CACHE_SHARED)
+
+    def store(self, key, token, version, shared):
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = (
+                copy.deepcopy(token),
+                time.monotonic() + settings.TOKEN_CACHE_TTL,
+            )
+            self.entries.move_to_end(key)
+            if len(self.entries) > settings.TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        if shared:
+            cache.set(
+                self.shared_key.format(version, digest(key)), token,
+                settings.TOKEN_CACHE_TTL,
+            )
+
+
+def digest(key):
+    """Ключ кеша без самого токена."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который берет пользователя из token_cache.
+
+    Только с общим кешем Django (SHARED_CACHE): иначе выход или смена
+    пароля в одном процессе не сбросили бы кеш токенов в остальных.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        token, version = token_cache.get(key)
+        if token is not None:
+            return token.user, token
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, token, version)
+        return user, token
@@ -0,0 +1,225 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.renderers import JSONRenderer
+
+
+def make_etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def etag_response(request, entry):
+    etag, content = entry
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+def query_key(query_params, ignored=()):
+    return tuple(
+        (param, tuple(sorted(set(values))))
+        for param, values in sorted(query_params.lists())
+        if param not in ignored
+    )
+
+
+class CatalogCache:
+    """
+    Готовые JSON-ответы справочников в памяти процесса.
+
+    Записи привязаны к общей версии каталога в кеше Django: при изменении
+    тегов или ингредиентов версия увеличивается, и каждый процесс сбрасывает
+    свои записи при следующем обращении. Ответ сохраняется, только если
+    версия не изменилась с начала его рендеринга.
+    """
+
+    version_key = 'catalog:version'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.version = None
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self, **kwargs):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+    def get(self, key):
+        """Версия каталога и запись по ключу (или None)."""
+        version = self.get_version()
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+                return version, None
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return version, entry
+
+    def set(self, key, content, version):
+        """Сохраняет ответ, отрендеренный при версии version."""
+        entry = (make_etag(content), content)
+        with self.lock:
+            if version != self.version:
+                return entry
+            self.entries[key] = entry
+            if len(self.entries) > settings.CATALOG_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        return entry
+
+
+catalog_cache = CatalogCache()
+
+
+class CatalogCacheMixin:
+    """Отдает list и retrieve справочника из catalog_cache с ETag."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = (
+            self.basename,
+            self.action,
+            kwargs.get(self.lookup_url_kwarg or self.lookup_field),
+            query_key(request.query_params),
+        )
+        version, entry = catalog_cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = catalog_cache.set(
+                key, JSONRenderer().render(response.data), version
+            )
+        return etag_response(request, entry)
+
+
+class ResponseCache:
+    """
+    Кеш готовых ответов в кеше Django с инвалидацией по тегам.
+
+    У каждого тега есть версия. Запись хранит версии своих тегов на момент
+    рендеринга и считается устаревшей, если хотя бы одна из них изменилась.
+    """
+
+    prefix = 'response'
+
+    @property
+    def cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def tag_versions(self, tags):
+        keys = {f'{self.prefix}:tag:{tag}': tag for tag in tags}
+        versions = self.cache.get_many(keys)
+        for key in keys.keys() - versions.keys():
+            self.cache.add(key, time.time_ns(), None)
+            versions[key] = self.cache.get(key)
+        return {keys[key]: version for key, version in versions.items()}
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            key = f'{self.prefix}:tag:{tag}'
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, time.time_ns(), None)
+
+    def get(self, key):
+        entry = self.cache.get(f'{self.prefix}:{key}')
+        if entry is None:
+            return None
+        versions, content = entry
+        if self.tag_versions(versions) != versions:
+            return None
+        return content
+
+    def set(self, key, content, versions):
+        entry = (make_etag(content), content)
+        self.cache.set(
+            f'{self.prefix}:{key}',
+            (versions, entry),
+            settings.RESPONSE_CACHE_TIMEOUT,
+        )
+        return entry
+
+
+response_cache = ResponseCache()
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кеширует list и retrieve для анонимных пользователей.
+
+    Ответ не зависит от пользователя, поэтому ключ строится только
+    по действию, pk и нормализованной строке запроса.
+    """
+
+    # Фильтры, которые для анонимного пользователя ничего не меняют.
+    cache_ignored_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cache_tags(self, data):
+        """Дополнительные теги инвалидации для отрендеренных данных."""
+        return set()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (
+            not request.user.is_anonymous
+            or request.accepted_renderer.format != 'json'
+        ):
+            return handler(request, *args, **kwargs)
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        key = hashlib.md5(repr((
+            request.build_absolute_uri('/'),
+            self.basename,
+            self.action,
+            pk,
+            query_key(request.query_params, self.cache_ignored_params),
+        )).encode()).hexdigest()
+        entry = response_cache.get(key)
+        if entry is None:
+            tags = {'catalog', 'recipes' if pk is None else f'recipe:{pk}'}
+            versions = response_cache.tag_versions(tags)
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            versions.update(
+                response_cache.tag_versions(self.get_cache_tags(response.data))
+            )
+            entry = response_cache.set(
+                key, JSONRenderer().render(response.data), versions
+            )
+        return etag_response(request, entry)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+from PIL import ImageFont
+
+
+@register()
+def check_shopping_list_font(app_configs, **kwargs):
+    """PDF списка покупок рисуется шрифтом SHOPPING_LIST_FONT."""
+    try:
+        ImageFont.truetype(settings.SHOPPING_LIST_FONT)
+    except OSError as error:
+        return [Warning(
+            f'Не загружен шрифт SHOPPING_LIST_FONT '
+            f'{settings.SHOPPING_LIST_FONT}: {error}',
+            hint='Укажите TTF с кириллицей, например DejaVuSans.ttf; '
+                 'без него список покупок в PDF не скачивается.',
+            id='api.W001',
+        )]
+    return []
@@ -0,0 +1,221 @@
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from PIL import Image, ImageDraw, ImageFont
+
+
+class ShoppingListRenderer:
+    """
+    Базовый рендерер списка покупок.
+
+    render() — генератор байтовых фрагментов: строки ингредиентов читаются
+    по одной, поэтому память не зависит от размера корзины. При одинаковых
+    входных данных результат совпадает побайтно.
+    """
+    extension = None
+    content_type = None
+
+    def render(self, user, ingredients, today):
+        raise NotImplementedError
+
+
+class TextRenderer(ShoppingListRenderer):
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def render(self, user, ingredients, today):
+        yield (
+            f'Список покупок для: {user.get_full_name()}\n\n'
+            f'Дата: {today:%Y-%m-%d}\n\n'
+        ).encode()
+        separator = ''
+        for ingredient in ingredients:
+            yield (
+                f'{separator}- {ingredient["name"]} '
+                f'({ingredient["measurement_unit"]})'
+                f' - {ingredient["amount"]}'
+            ).encode()
+            separator = '\n'
+        yield f'\n\nFoodgram ({today:%Y})'.encode()
+
+
+class CSVRenderer(ShoppingListRenderer):
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def render(self, user, ingredients, today):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            writer.writerow((
+                ingredient['name'],
+                ingredient['measurement_unit'],
+                ingredient['amount'],
+            ))
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode()
+
+
+class JSONRenderer(ShoppingListRenderer):
+    extension = 'json'
+    content_type = 'application/json'
+
+    def render(self, user, ingredients, today):
+        header = json.dumps({
+            'user': user.get_full_name(),
+            'date': f'{today:%Y-%m-%d}',
+        }, ensure_ascii=False, sort_keys=True)
+        yield f'{header[:-1]}, "ingredients": ['.encode()
+        separator = ''
+        for ingredient in ingredients:
+            item = json.dumps({
+                'name': ingredient['name'],
+                'measurement_unit': ingredient['measurement_unit'],
+                'amount': ingredient['amount'],
+            }, ensure_ascii=False, sort_keys=True)
+            yield f'{separator}{item}'.encode()
+            separator = ', '
+        yield b']}'
+
+
+class PDFRenderer(ShoppingListRenderer):
+    """
+    PDF из растровых страниц A4, шрифт берется из SHOPPING_LIST_FONT.
+
+    Страницы рисуются и записываются по одной, объект /Pages
+    с их списком пишется в конце файла. Шрифт загружается при создании
+    рендерера, до начала ответа: без TTF с кириллицей PDF не отдается.
+    """
+    extension = 'pdf'
+    content_type = 'application/pdf'
+    dpi = 150
+    page_size = (1240, 1754)
+    margin = 90
+    font_size = 28
+    line_height = 44
+
+    def __init__(self):
+        self.font = self.get_font()
+
+    def get_font(self):
+        # Встроенный шрифт Pillow не содержит кириллицы.
+        try:
+            return ImageFont.truetype(
+                settings.SHOPPING_LIST_FONT, self.font_size
+            )
+        except OSError as error:
+            raise ImproperlyConfigured(
+                f'Не загружен шрифт SHOPPING_LIST_FONT '
+                f'{settings.SHOPPING_LIST_FONT}: {error}'
+            )
+
+    def get_lines(self, user, ingredients, today):
+        yield f'Список покупок для: {user.get_full_name()}'
+        yield f'Дата: {today:%Y-%m-%d}'
+        yield ''
+        for ingredient in ingredients:
+            yield (
+                f'- {ingredient["name"]} '
+                f'({ingredient["measurement_unit"]})'
+                f' - {ingredient["amount"]}'
+            )
+        yield ''
+        yield f'Foodgram ({today:%Y})'
+
+    def get_pages(self, lines):
+        lines_per_page = (
+            (self.page_size[1] - 2 * self.margin) // self.line_height
+        )
+        page = []
+        for line in lines:
+            page.append(line)
+            if len(page) == lines_per_page:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def draw_page(self, lines, font):
+        image = Image.new('L', self.page_size, 255)
+        draw = ImageDraw.Draw(image)
+        for number, line in enumerate(lines):
+            draw.text(
+                (self.margin, self.margin + number * self.line_height),
+                line, font=font, fill=0,
+            )
+        return image
+
+    def render(self, user, ingredients, today):
+        width, height = (
+            round(size * 72 / self.dpi, 2) for size in self.page_size
+        )
+        offsets = []
+        position = 0
+
+        def write_object(body, stream=None):
+            nonlocal position
+            offsets.append(position)
+            chunk = f'{len(offsets)} 0 obj\n{body}\n'.encode()
+            if stream is not None:
+                chunk += b'stream\n' + stream + b'\nendstream\n'
+            chunk += b'endobj\n'
+            position += len(chunk)
+            return chunk
+
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        position = len(header)
+        yield header
+        # Номера 1 и 2 зарезервированы за /Catalog и /Pages.
+        yield write_object('<< /Type /Catalog /Pages 2 0 R >>')
+        pages_offset = len(offsets)
+        offsets.append(None)
+        page_ids = []
+        for lines in self.get_pages(self.get_lines(user, ingredients, today)):
+            data = zlib.compress(self.draw_page(lines, self.font).tobytes(), 9)
+            yield write_object(
+                f'<< /Type /XObject /Subtype /Image'
+                f' /Width {self.page_size[0]} /Height {self.page_size[1]}'
+                f' /ColorSpace /DeviceGray /BitsPerComponent 8'
+                f' /Filter /FlateDecode /Length {len(data)} >>',
+                data,
+            )
+            image_id = len(offsets)
+            content = f'q {width} 0 0 {height} 0 0 cm /Im0 Do Q'.encode()
+            yield write_object(f'<< /Length {len(content)} >>', content)
+            yield write_object(
+                f'<< /Type /Page /Parent 2 0 R'
+                f' /MediaBox [0 0 {width} {height}]'
+                f' /Resources << /XObject << /Im0 {image_id} 0 R >> >>'
+                f' /Contents {image_id + 1} 0 R >>'
+            )
+            page_ids.append(len(offsets))
+
+        kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+        offsets[pages_offset] = position
+        chunk = (
+            f'2 0 obj\n<< /Type /Pages /Kids [{kids}]'
+            f' /Count {len(page_ids)} >>\nendobj\n'
+        ).encode()
+        position += len(chunk)
+        yield chunk
+
+        xref = [f'xref\n0 {len(offsets) + 1}\n', '0000000000 65535 f \n']
+        xref += [f'{offset:010d} 00000 n \n' for offset in offsets]
+        yield ''.join(xref).encode()
+        yield (
+            f'trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n'
+            f'startxref\n{position}\n%%EOF\n'
+        ).encode()
+
+
+RENDERERS = {
+    renderer.extension: renderer
+    for renderer in (TextRenderer, CSVRenderer, JSONRenderer, PDFRenderer)
+}
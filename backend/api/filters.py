@@ -1,18 +1,23 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import RECIPE_ORDERINGS, Ingredient, Recipe, Tag
+from recipes.search import ingredient_search, recipe_search
 
 User = get_user_model()
 
 
 class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='startswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
 
+    def filter_name(self, queryset, name, value):
+        return ingredient_search.search(queryset, value)
+
 
 class RecipeFilter(FilterSet):
 
@@ -20,17 +25,52 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')),
+        method='filter_tags_mode',
     )
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart',
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты с любым (tags_mode=any) или всеми (all) тегами.
+
+        Каждое условие — EXISTS по уникальному индексу (recipe, tag)
+        без соединения, поэтому рецепты не дублируются.
+        """
+        if not value:
+            return queryset
+        tag_ids = [tag.id for tag in value]
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            groups = [[tag_id] for tag_id in tag_ids]
+        else:
+            groups = [tag_ids]
+        for group in groups:
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'), tag_id__in=group
+                )
+            ))
+        return queryset
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -42,3 +82,9 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(shopping_cart__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return recipe_search.search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,153 @@
+import logging
+import random
+import re
+import tempfile
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment
+
+from api.profiling import explain
+
+from .benchmark_api import ENDPOINTS
+from .benchmark_api import Command as ApiBenchmark
+
+# Строка плана, в которой таблица читается целиком, без индекса.
+# Автоматический индекс SQLite строится тем же чтением всей таблицы.
+SEQUENTIAL_SCANS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(
+        r'\bSCAN (?:TABLE )?(?!CONSTANT ROW|SUBQUERY)(\w+)'
+        r'(?:(?! USING ).)*$'
+        r'|\bSEARCH (?:TABLE )?(\w+) .*USING AUTOMATIC'
+    ),
+}
+# Псевдонимы таблиц в подзапросах Django: "recipes_recipe" U0.
+ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)\b')
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN SQL-запросов всех эндпоинтов API на синтетических данных: '
+        'запросы с условиями, которые читают таблицу целиком, без индекса'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-file',
+                            default='data/ingredients.csv')
+        parser.add_argument('--allow', action='append', default=[],
+                            metavar='TABLE',
+                            help='Таблица, которую можно читать целиком')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Печатать планы запросов со сканированием')
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCANS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'Аудит не поддерживает {connection.vendor}'
+            )
+        setup_test_environment()
+        random.seed(0)
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        scans = {}
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                with transaction.atomic():
+                    if connection.vendor == 'postgresql':
+                        # На маленьких таблицах планировщик выбирает
+                        # Seq Scan и при наличии индекса: без него Seq
+                        # Scan остается только там, где индекса нет.
+                        with connection.cursor() as cursor:
+                            cursor.execute('SET LOCAL enable_seqscan = off')
+                    ctx = ApiBenchmark().seed({
+                        'users': options['users'],
+                        'recipes': options['recipes'],
+                        'tags': 6,
+                        'ingredients_per_recipe': 8,
+                        'favorites': 30,
+                        'carts': 10,
+                        'ingredients_file': options['ingredients_file'],
+                    })
+                    tables = set(connection.introspection.table_names())
+                    tables -= set(options['allow'])
+                    for endpoint in ENDPOINTS:
+                        for sql, plan, scanned in self.audit(
+                            ctx, endpoint, pattern
+                        ):
+                            if not scanned & tables:
+                                continue
+                            scan = scans.setdefault(sql, {
+                                'plan': plan,
+                                'tables': scanned & tables,
+                                'endpoints': set(),
+                            })
+                            scan['endpoints'].add(
+                                f'{endpoint.method.upper()} {endpoint.path}'
+                            )
+                    transaction.set_rollback(True)
+
+        if not scans:
+            self.stdout.write(self.style.SUCCESS(
+                'Все запросы эндпоинтов с условиями используют индексы'
+            ))
+            return
+        for sql, scan in sorted(
+            scans.items(), key=lambda item: sorted(item[1]['tables'])
+        ):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Сканирование ' + ', '.join(sorted(scan['tables']))
+            ))
+            for endpoint in sorted(scan['endpoints']):
+                self.stdout.write(f'  {endpoint}')
+            self.stdout.write(f'  {sql}')
+            if options['verbose_plans']:
+                for line in scan['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
+        raise CommandError(
+            f'Запросов со сканированием таблиц без индекса: {len(scans)}'
+        )
+
+    def audit(self, ctx, endpoint, pattern):
+        """SELECT эндпоинта с планом и таблицами, прочитанными целиком."""
+        path = endpoint.path.format(**ctx)
+        data = endpoint.data(ctx) if endpoint.data else None
+        for authenticated in (False, True):
+            client = ApiBenchmark().client(ctx, authenticated)
+            queries = []
+
+            def capture(execute, sql, params, many, context):
+                queries.append((sql, params, many))
+                return execute(sql, params, many, context)
+
+            with transaction.atomic():
+                with connection.execute_wrapper(capture):
+                    getattr(client, endpoint.method)(
+                        path, data, format='json'
+                    )
+                for sql, params, many in queries:
+                    # Запросы без условий читают таблицу целиком
+                    # намеренно: так строятся индексы в памяти.
+                    if (
+                        many or sql.lstrip()[:6].upper() != 'SELECT'
+                        or ' WHERE ' not in sql
+                    ):
+                        continue
+                    plan = explain(connection.alias, sql, params)
+                    aliases = {
+                        alias: table for table, alias in ALIAS.findall(sql)
+                    }
+                    tables = {
+                        aliases.get(name, name)
+                        for name in (
+                            match.group(match.lastindex)
+                            for match in map(pattern.search,
+                                             plan.splitlines())
+                            if match
+                        )
+                    }
+                    if tables:
+                        yield sql, plan, tables
+                transaction.set_rollback(True)
@@ -0,0 +1,484 @@
+import csv
+import logging
+import random
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment)
+from django.urls import URLResolver
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import urls as api_urls
+from recipes.counters import COUNTERS, recount
+from recipes.models import (RECIPE_ORDERINGS, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.recommendations import build_recommendations
+from recipes.search import recipe_search
+from users.models import Subscribe
+
+User = get_user_model()
+
+PREFIX = 'bench'
+PASSWORD = 'Bench-password-123'
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+Endpoint = namedtuple(
+    'Endpoint', ('name', 'method', 'path', 'data', 'anon', 'auth')
+)
+
+
+def recipe_payload(ctx):
+    return {
+        'name': f'{PREFIX} new recipe',
+        'text': 'text',
+        'cooking_time': 10,
+        'image': IMAGE,
+        'tags': ctx['tags'][:2],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 5}
+            for ingredient_id in ctx['ingredients'][:10]
+        ],
+    }
+
+
+def user_payload(ctx):
+    return {
+        'email': f'{PREFIX}_new@example.com',
+        'username': f'{PREFIX}_new',
+        'first_name': 'Bench',
+        'last_name': 'New',
+        'password': PASSWORD,
+    }
+
+
+def login_payload(ctx):
+    return {'email': ctx['email'], 'password': PASSWORD}
+
+
+# Бюджеты — максимальное число SQL-запросов на запрос
+# для анонимного и авторизованного пользователя.
+ENDPOINTS = (
+    # Первый авторизованный запрос кладет токен в кеш: дальше
+    # пользователь берется без запроса к authtoken_token.
+    Endpoint('api-root', 'get', '/api/', None, 0, 1),
+    Endpoint('ingredients-list', 'get', '/api/ingredients/?name=а',
+             None, 3, 2),
+    Endpoint('ingredients-detail', 'get', '/api/ingredients/{ingredient}/',
+             None, 1, 1),
+    Endpoint('tags-list', 'get', '/api/tags/', None, 2, 2),
+    Endpoint('tags-detail', 'get', '/api/tags/{tag}/', None, 1, 1),
+    Endpoint('recipes-list', 'get', '/api/recipes/', None, 4, 5),
+    Endpoint('recipes-list', 'get', '/api/recipes/?pagination=cursor',
+             None, 3, 4),
+    Endpoint('recipes-list', 'get', '/api/recipes/?tags={tag_slug}',
+             None, 5, 6),
+    Endpoint('recipes-list', 'get',
+             '/api/recipes/?tags={tag_slug}&tags={other_tag_slug}',
+             None, 5, 6),
+    Endpoint('recipes-list', 'get',
+             '/api/recipes/?tags={tag_slug}&tags={other_tag_slug}'
+             '&tags_mode=all',
+             None, 5, 6),
+    Endpoint('recipes-list', 'get', '/api/recipes/?author={author}',
+             None, 5, 6),
+    Endpoint('recipes-list', 'get',
+             '/api/recipes/?is_favorited=1&is_in_shopping_cart=1',
+             None, 4, 5),
+    *(
+        Endpoint('recipes-list', 'get', f'/api/recipes/?ordering={name}',
+                 None, 4, 5)
+        for name in RECIPE_ORDERINGS
+    ),
+    Endpoint('recipes-list', 'get',
+             '/api/recipes/?ordering=popular&pagination=cursor',
+             None, 3, 4),
+    # Без PostgreSQL первый поиск строит индекс в памяти: +2 запроса.
+    Endpoint('recipes-list', 'get', '/api/recipes/?search=synthetic recipe',
+             None, 6, 5),
+    Endpoint('recipes-list', 'get',
+             '/api/recipes/?search=synthetic&pagination=cursor',
+             None, 3, 4),
+    Endpoint('recipes-list', 'post', '/api/recipes/', recipe_payload, 0, 13),
+    Endpoint('recipes-detail', 'get', '/api/recipes/{recipe}/', None, 3, 4),
+    # Рецепт есть в чужой корзине: изменение состава переносится в нее.
+    Endpoint('recipes-detail', 'patch', '/api/recipes/{own_recipe}/',
+             recipe_payload, 0, 22),
+    Endpoint('recipes-detail', 'delete', '/api/recipes/{own_recipe}/',
+             None, 0, 16),
+    Endpoint('recipes-favorite', 'post', '/api/recipes/{recipe}/favorite/',
+             None, 0, 6),
+    Endpoint('recipes-favorite', 'delete',
+             '/api/recipes/{favorite}/favorite/', None, 0, 4),
+    Endpoint('recipes-shopping-cart', 'post',
+             '/api/recipes/{recipe}/shopping_cart/', None, 0, 10),
+    Endpoint('recipes-shopping-cart', 'delete',
+             '/api/recipes/{in_cart}/shopping_cart/', None, 0, 7),
+    # Первый запрос строит индекс в памяти: +4 запроса.
+    Endpoint('recipes-match', 'get', '/api/recipes/match/?{pantry}',
+             None, 7, 4),
+    Endpoint('recipes-match', 'get',
+             '/api/recipes/match/?{pantry}&max_time=60&tags={tag_slug}',
+             None, 4, 5),
+    Endpoint('recipes-similar', 'get', '/api/recipes/{recipe}/similar/',
+             None, 3, 4),
+    Endpoint('recipes-recommended', 'get', '/api/recipes/recommended/',
+             None, 0, 6),
+    Endpoint('recipes-recommended', 'get',
+             '/api/recipes/recommended/?pagination=cursor', None, 0, 5),
+    Endpoint('recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', None, 0, 2),
+    Endpoint('users-list', 'get', '/api/users/', None, 2, 3),
+    Endpoint('users-list', 'post', '/api/users/', user_payload, 5, 6),
+    Endpoint('users-detail', 'get', '/api/users/{author}/', None, 1, 2),
+    Endpoint('users-me', 'get', '/api/users/me/', None, 0, 0),
+    Endpoint('users-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', None, 0, 3),
+    Endpoint('users-subscribe', 'post', '/api/users/{author}/subscribe/',
+             None, 0, 5),
+    Endpoint('users-subscribe', 'delete',
+             '/api/users/{subscribed}/subscribe/', None, 0, 3),
+    Endpoint('users-set-password', 'post', '/api/users/set_password/',
+             None, 0, 0),
+    Endpoint('users-set-username', 'post', '/api/users/set_email/',
+             None, 0, 0),
+    Endpoint('users-activation', 'post', '/api/users/activation/',
+             None, 0, 0),
+    Endpoint('users-resend-activation', 'post',
+             '/api/users/resend_activation/', None, 0, 0),
+    Endpoint('users-reset-password', 'post',
+             '/api/users/reset_password/', None, 0, 0),
+    Endpoint('users-reset-password-confirm', 'post',
+             '/api/users/reset_password_confirm/', None, 0, 0),
+    Endpoint('users-reset-username', 'post', '/api/users/reset_email/',
+             None, 0, 0),
+    Endpoint('users-reset-username-confirm', 'post',
+             '/api/users/reset_email_confirm/', None, 0, 0),
+    Endpoint('user-list', 'get', '/api/auth/users/', None, 2, 3),
+    Endpoint('user-detail', 'get', '/api/auth/users/{author}/', None, 1, 2),
+    Endpoint('user-me', 'get', '/api/auth/users/me/', None, 0, 0),
+    Endpoint('user-set-password', 'post', '/api/auth/users/set_password/',
+             None, 0, 0),
+    Endpoint('user-set-username', 'post', '/api/auth/users/set_email/',
+             None, 0, 0),
+    Endpoint('user-activation', 'post', '/api/auth/users/activation/',
+             None, 0, 0),
+    Endpoint('user-resend-activation', 'post',
+             '/api/auth/users/resend_activation/', None, 0, 0),
+    Endpoint('user-reset-password', 'post',
+             '/api/auth/users/reset_password/', None, 0, 0),
+    Endpoint('user-reset-password-confirm', 'post',
+             '/api/auth/users/reset_password_confirm/', None, 0, 0),
+    Endpoint('user-reset-username', 'post', '/api/auth/users/reset_email/',
+             None, 0, 0),
+    Endpoint('user-reset-username-confirm', 'post',
+             '/api/auth/users/reset_email_confirm/', None, 0, 0),
+    Endpoint('login', 'post', '/api/auth/token/login/', login_payload, 3, 4),
+    Endpoint('logout', 'post', '/api/auth/token/logout/', None, 0, 2),
+)
+
+# Запросы сверх бюджета на отдельных СУБД по (имени, методу). На
+# PostgreSQL после записи рецепта search_vector пересчитывается отдельным
+# UPDATE, на остальных СУБД сбрасывается индекс в памяти без запросов.
+VENDOR_QUERIES = {
+    'postgresql': {
+        ('recipes-list', 'post'): 1,
+        ('recipes-detail', 'patch'): 1,
+    },
+}
+
+# Число запросов не должно зависеть от размера страницы
+# и от recipes_limit: {} заменяется на маленькое и большое значение.
+GROWTH_CHECKS = (
+    ('recipes-list', '/api/recipes/?limit={}'),
+    ('recipes-list', '/api/recipes/?pagination=cursor&limit={}'),
+    ('ingredients-list', '/api/ingredients/?limit={}'),
+    ('users-list', '/api/users/?limit={}'),
+    ('users-subscriptions', '/api/users/subscriptions/?limit={}'),
+    ('users-subscriptions', '/api/users/subscriptions/?recipes_limit={}'),
+    ('users-subscriptions',
+     '/api/users/subscriptions/?pagination=cursor&limit={}'),
+)
+
+
+def walk_url_names(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from walk_url_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер числа SQL-запросов, времени и размера ответа '
+        'для всех эндпоинтов API на синтетических данных'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--ingredients-file',
+                            default='data/ingredients.csv')
+        parser.add_argument('--page-size', type=int, default=20,
+                            help='Большой размер страницы для проверки роста')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Не откатывать сгенерированные данные')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        random.seed(options['seed'])
+        self.repeat = options['repeat']
+        failures = []
+        # Ответы 4xx ожидаемы и не должны засорять вывод.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        # Команда работает в одном процессе, поэтому кеш в памяти ведет
+        # себя как общий: бюджеты считаются для конфигурации с общим кешем.
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root, SHARED_CACHE=True):
+                with transaction.atomic():
+                    ctx = self.seed(options)
+                    failures += self.check_coverage()
+                    failures += self.run_endpoints(ctx)
+                    failures += self.run_growth_checks(
+                        ctx, options['page_size']
+                    )
+                    if not options['keep_data']:
+                        transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты запросов:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
+
+    def seed(self, options):
+        if not Ingredient.objects.exists():
+            with open(
+                options['ingredients_file'], 'r', encoding='utf-8'
+            ) as file:
+                Ingredient.objects.bulk_create(
+                    Ingredient(**data) for data in csv.DictReader(file)
+                )
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+
+        Tag.objects.bulk_create(
+            Tag(
+                name=f'{PREFIX} tag {i}',
+                slug=f'{PREFIX}-tag-{i}',
+                color=f'#be{i:04x}',
+            )
+            for i in range(options['tags'])
+        )
+        tags = list(Tag.objects.filter(slug__startswith=f'{PREFIX}-tag-'))
+
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(
+                email=f'{PREFIX}_{i}@example.com',
+                username=f'{PREFIX}_{i}',
+                first_name='Bench',
+                last_name=str(i),
+                password=password,
+            )
+            for i in range(options['users'])
+        )
+        users = list(
+            User.objects.filter(username__startswith=f'{PREFIX}_')
+            .order_by('id')
+        )
+        # Зритель не первый в списке пользователей: иначе на странице из
+        # одного пользователя нет чужих подписок и запрос за ними пропадает.
+        outsider, viewer, authors = users[0], users[1], users[2:]
+
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'{PREFIX} recipe {i}',
+                author=users[i % len(users)],
+                image='recipes/benchmark.png',
+                cooking_time=random.randint(1, 120),
+                text='Synthetic recipe',
+            )
+            for i in range(options['recipes'])
+        )
+        recipes = list(
+            Recipe.objects.filter(name__startswith=f'{PREFIX} recipe ')
+            .order_by('id')
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in random.sample(tags, min(2, len(tags)))
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id,
+                amount=random.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient_id in random.sample(
+                ingredients, options['ingredients_per_recipe']
+            )
+        )
+        for model, per_user in (
+            (Favorite, options['favorites']),
+            (ShoppingCart, options['carts']),
+        ):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in users
+                for recipe in random.sample(
+                    recipes, min(per_user, len(recipes))
+                )
+            )
+        # Свой рецепт зрителя, который он меняет и удаляет, всегда есть
+        # в чужом избранном и корзине: бюджеты считаются для худшего случая.
+        own_recipe = next(
+            recipe for recipe in recipes if recipe.author == viewer
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.get_or_create(user=outsider, recipe=own_recipe)
+        ShoppingCartIngredient.objects.rebuild([user.id for user in users])
+        Subscribe.objects.bulk_create(
+            Subscribe(user=user, author=author)
+            for user in users
+            for author in (
+                authors if user == viewer
+                else random.sample(authors, min(5, len(authors)))
+            )
+            if author != user
+        )
+        for counter in COUNTERS:
+            recount(counter)
+        recipe_search.refresh()
+        build_recommendations()
+
+        others = [recipe for recipe in recipes if recipe.author != viewer]
+        return {
+            'viewer': viewer,
+            'email': viewer.email,
+            'token': Token.objects.create(user=viewer).key,
+            'tags': [tag.id for tag in tags],
+            'tag': tags[0].id,
+            'tag_slug': tags[0].slug,
+            'other_tag_slug': tags[1].slug,
+            'ingredients': ingredients,
+            'ingredient': ingredients[0],
+            'pantry': '&'.join(
+                f'ingredients={ingredient_id}'
+                for ingredient_id in IngredientRecipe.objects.filter(
+                    recipe=recipes[0]
+                ).values_list('ingredient_id', flat=True)[:5]
+            ),
+            'recipe': next(
+                recipe.id for recipe in others
+                if not viewer.favorites.filter(recipe=recipe).exists()
+                and not viewer.shopping_cart.filter(recipe=recipe).exists()
+            ),
+            'own_recipe': own_recipe.id,
+            'favorite': viewer.favorites.values_list(
+                'recipe', flat=True
+            ).first(),
+            'in_cart': viewer.shopping_cart.values_list(
+                'recipe', flat=True
+            ).first(),
+            'author': outsider.id,
+            'subscribed': authors[0].id,
+        }
+
+    def client(self, ctx, authenticated):
+        client = APIClient()
+        if authenticated:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {ctx["token"]}')
+        return client
+
+    def measure(self, client, method, path, data=None):
+        """Выполняет запрос в откатываемой транзакции."""
+        timings, queries = [], 0
+        for _ in range(self.repeat):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(
+                        path, data, format='json'
+                    )
+                    if response.streaming:
+                        size = len(b''.join(response.streaming_content))
+                    else:
+                        size = len(response.content)
+                    timings.append(time.perf_counter() - start)
+                transaction.set_rollback(True)
+            queries = max(queries, len(captured.captured_queries))
+        return response.status_code, queries, statistics.median(timings), size
+
+    def check_coverage(self):
+        covered = {endpoint.name for endpoint in ENDPOINTS}
+        return [
+            f'{name}: нет бюджета для маршрута'
+            for name in sorted(
+                set(walk_url_names(api_urls.urlpatterns)) - covered
+            )
+        ]
+
+    def run_endpoints(self, ctx):
+        failures = []
+        extra = VENDOR_QUERIES.get(connection.vendor, {})
+        self.stdout.write(
+            f'{"endpoint":<32}{"method":<8}{"user":<6}{"status":>7}'
+            f'{"queries":>9}{"budget":>8}{"ms":>9}{"bytes":>10}'
+        )
+        for endpoint in ENDPOINTS:
+            path = endpoint.path.format(**ctx)
+            data = endpoint.data(ctx) if endpoint.data else None
+            for user, budget in (('anon', endpoint.anon),
+                                 ('auth', endpoint.auth)):
+                if budget:
+                    budget += extra.get((endpoint.name, endpoint.method), 0)
+                status, queries, elapsed, size = self.measure(
+                    self.client(ctx, user == 'auth'),
+                    endpoint.method, path, data,
+                )
+                line = (
+                    f'{endpoint.name:<32}{endpoint.method.upper():<8}'
+                    f'{user:<6}{status:>7}{queries:>9}{budget:>8}'
+                    f'{elapsed * 1000:>9.1f}{size:>10}'
+                )
+                if queries > budget:
+                    failures.append(f'{line}  ({path})')
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+        return failures
+
+    def run_growth_checks(self, ctx, page_size):
+        failures = []
+        for name, template in GROWTH_CHECKS:
+            for user in ('anon', 'auth'):
+                client = self.client(ctx, user == 'auth')
+                small, large = (
+                    self.measure(client, 'get', template.format(size))[1]
+                    for size in (1, page_size)
+                )
+                if large > small:
+                    failures.append(
+                        f'{name} ({user}): {small} запросов при 1 и '
+                        f'{large} при {page_size} — {template}'
+                    )
+        return failures
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe, Tag
+
+MODES = ('wsgi', 'asgi')
+
+
+async def fetch(reader, writer, request):
+    """Отправляет запрос и дочитывает ответ; возвращает статус и Connection."""
+    writer.write(request)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Сервер закрыл соединение')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    return int(status_line.split()[1]), headers.get('connection') == 'close'
+
+
+async def client(host, port, request, deadline, latencies, errors):
+    """Шлет запросы по одному соединению keep-alive до deadline."""
+    connection = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            status, close = await fetch(*connection, request)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError):
+            errors.append(None)
+            connection = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+        if close:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def load(host, port, request, concurrency, duration):
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(
+        client(host, port, request, deadline, latencies, errors)
+        for _ in range(concurrency)
+    ))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест горячих маршрутов чтения: запросы в секунду '
+        'и p99 при WSGI и ASGI с одинаковым числом воркеров'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес уже запущенного сервера; без него команда сама '
+                 'запускает gunicorn в режимах --modes',
+        )
+        parser.add_argument('--modes', nargs='+', choices=MODES,
+                            default=list(MODES))
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Больше одного — только с общим '
+                                 'CACHE_BACKEND')
+        parser.add_argument(
+            '--cpus',
+            help='Ядра для сервера в формате taskset, например 0-1',
+        )
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд нагрузки на маршрут')
+        parser.add_argument('--warmup', type=float, default=1)
+        parser.add_argument(
+            '--token',
+            help='Токен авторизации; анонимам список и детали рецептов '
+                 'отдаются из кеша ответов',
+        )
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Маршрут, можно указать несколько раз')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        if options['url']:
+            url = urlsplit(options['url'])
+            self.run(
+                url.netloc or options['url'], url.hostname, url.port or 80,
+                paths, options,
+            )
+            return
+        if options['workers'] > 1 and not settings.SHARED_CACHE:
+            raise CommandError(
+                'Несколько воркеров требуют общего CACHE_BACKEND'
+            )
+        for mode in options['modes']:
+            with self.server(mode, options):
+                self.run(mode, '127.0.0.1', options['port'], paths, options)
+
+    def default_paths(self):
+        recipe = Recipe.objects.values_list('id', flat=True).first()
+        ingredient = Ingredient.objects.values_list('id', flat=True).first()
+        tag = Tag.objects.values_list('id', flat=True).first()
+        if None in (recipe, ingredient, tag):
+            raise CommandError(
+                'Нужны рецепты, ингредиенты и теги в базе или --path'
+            )
+        return [
+            '/api/recipes/',
+            f'/api/recipes/{recipe}/',
+            '/api/ingredients/?name=а',
+            f'/api/ingredients/{ingredient}/',
+            '/api/tags/',
+            f'/api/tags/{tag}/',
+        ]
+
+    def server(self, mode, options):
+        command = [sys.executable, '-m', 'gunicorn']
+        if options['cpus']:
+            command = ['taskset', '-c', options['cpus'], *command]
+        process = subprocess.Popen(
+            command,
+            cwd=settings.BASE_DIR,
+            env=dict(
+                os.environ,
+                SERVER_MODE=mode,
+                GUNICORN_BIND=f'127.0.0.1:{options["port"]}',
+                GUNICORN_WORKERS=str(options['workers']),
+            ),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return ServerProcess(process, options['port'])
+
+    def run(self, label, host, port, paths, options):
+        self.stdout.write(
+            f'{label}: {options["concurrency"]} соединений, '
+            f'{options["duration"]:g} с на маршрут'
+        )
+        self.stdout.write(
+            f'{"path":<32}{"rps":>9}{"p50 ms":>9}{"p99 ms":>9}'
+            f'{"errors":>8}'
+        )
+        headers = f'Host: {host}:{port}\r\n'
+        if options['token']:
+            headers += f'Authorization: Token {options["token"]}\r\n'
+        for path in paths:
+            request = (
+                f'GET {quote(path, safe="/?=&")} HTTP/1.1\r\n{headers}\r\n'
+            ).encode()
+            asyncio.run(load(
+                host, port, request, options['concurrency'],
+                options['warmup'],
+            ))
+            latencies, errors = asyncio.run(load(
+                host, port, request, options['concurrency'],
+                options['duration'],
+            ))
+            latencies.sort()
+            line = f'{path:<32}{len(latencies) / options["duration"]:>9.1f}'
+            if latencies:
+                line += (
+                    f'{latencies[len(latencies) // 2] * 1000:>9.1f}'
+                    f'{latencies[int(len(latencies) * 0.99)] * 1000:>9.1f}'
+                )
+            else:
+                line += f'{"-":>9}{"-":>9}'
+            line += f'{len(errors):>8}'
+            self.stdout.write(self.style.ERROR(line) if errors else line)
+
+
+class ServerProcess:
+    """Запущенный gunicorn: ждет готовности порта и останавливается."""
+
+    def __init__(self, process, port, timeout=30):
+        self.process = process
+        self.port = port
+        self.timeout = timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('gunicorn завершился при запуске')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), 1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.process.terminate()
+        raise CommandError('gunicorn не начал принимать соединения')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings, setup_test_environment
+from rest_framework.test import APIClient
+
+from .benchmark_api import Command as ApiBenchmark
+
+MIDDLEWARE = 'api.middleware.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = (
+        'Накладные расходы MetricsMiddleware: время запросов без метрик, '
+        'с выборкой METRICS_SAMPLE_RATE и с полной выборкой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Запросов на маршрут в раунде')
+        parser.add_argument('--rounds', type=int, default=7)
+        parser.add_argument(
+            '--budget-percent', type=float, default=2,
+            help='Допустимый рост времени при METRICS_SAMPLE_RATE, %%',
+        )
+        parser.add_argument('--ingredients-file',
+                            default='data/ingredients.csv')
+
+    def handle(self, *args, **options):
+        if not settings.METRICS_ENABLED:
+            raise CommandError('Метрики выключены: METRICS_ENABLED=false')
+        setup_test_environment()
+        random.seed(0)
+        with transaction.atomic():
+            ctx = ApiBenchmark().seed({
+                'users': 10,
+                'recipes': 100,
+                'tags': 6,
+                'ingredients_per_recipe': 8,
+                'favorites': 20,
+                'carts': 5,
+                'ingredients_file': options['ingredients_file'],
+            })
+            timings = self.run(ctx, options)
+            transaction.set_rollback(True)
+
+        baseline = statistics.median(timings['off'])
+        self.stdout.write(f'{"mode":<10}{"ms/request":>12}{"overhead":>10}')
+        failure = None
+        for mode, values in timings.items():
+            elapsed = statistics.median(values)
+            overhead = (elapsed / baseline - 1) * 100
+            line = f'{mode:<10}{elapsed * 1000:>12.3f}{overhead:>9.1f}%'
+            if mode == 'sampled' and overhead > options['budget_percent']:
+                failure = line
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if failure:
+            raise CommandError(f'Превышены накладные расходы: {failure}')
+        self.stdout.write(self.style.SUCCESS(
+            'Накладные расходы в пределах бюджета'
+        ))
+
+    def run(self, ctx, options):
+        paths = (
+            '/api/recipes/',
+            f'/api/recipes/{ctx["recipe"]}/',
+            '/api/tags/',
+            '/api/users/subscriptions/',
+        )
+        other = [
+            middleware for middleware in settings.MIDDLEWARE
+            if middleware != MIDDLEWARE
+        ]
+        modes = {
+            'off': {'MIDDLEWARE': other},
+            'sampled': {'MIDDLEWARE': [MIDDLEWARE, *other]},
+            'full': {
+                'MIDDLEWARE': [MIDDLEWARE, *other],
+                'METRICS_SAMPLE_RATE': 1.0,
+            },
+        }
+        timings = {mode: [] for mode in modes}
+        for _ in range(options['rounds']):
+            # Порядок режимов меняется, чтобы дрейф не копился в одном.
+            for mode in random.sample(list(modes), len(modes)):
+                with override_settings(**modes[mode]):
+                    client = APIClient()
+                    client.credentials(
+                        HTTP_AUTHORIZATION=f'Token {ctx["token"]}'
+                    )
+                    for path in paths:
+                        client.get(path)
+                    start = time.perf_counter()
+                    for _ in range(options['requests']):
+                        for path in paths:
+                            client.get(path)
+                    timings[mode].append(
+                        (time.perf_counter() - start)
+                        / (options['requests'] * len(paths))
+                    )
+        return timings
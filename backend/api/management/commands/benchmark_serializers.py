@@ -0,0 +1,169 @@
+import base64
+import os
+import random
+import statistics
+import tempfile
+import time
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings, setup_test_environment
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import (ImageURLField, RecipeBaseSerializer,
+                             RecipeListSerializer, SubscribeSerializer)
+from recipes.models import Recipe
+from users.models import User
+
+from .benchmark_api import IMAGE, Command as ApiBenchmark
+
+# Варианты поля image: ссылка без обращения к хранилищу, прежний
+# Base64ImageField со ссылкой и он же с содержимым файла.
+MODES = {
+    'url': ImageURLField,
+    'field': Base64ImageField,
+    'base64': lambda: Base64ImageField(represent_in_base64=True),
+}
+
+# Обращения к файлам, которых не должно быть при рендеринге ссылок.
+STORAGE_METHODS = ('exists', 'size', 'open', 'path', 'get_modified_time')
+
+
+class Command(BaseCommand):
+    help = (
+        'Микробенчмарк сериализации страниц рецептов и подписок: '
+        'время на рецепт и число обращений к файлам изображений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=400)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--ingredients-file',
+                            default='data/ingredients.csv')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        random.seed(0)
+        self.repeat = options['repeat']
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                self.write_image(media_root)
+                with transaction.atomic():
+                    failures = self.run(options)
+                    transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Рендеринг обращается к файлам:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Файлы не затрагиваются'))
+
+    def write_image(self, media_root):
+        path = os.path.join(media_root, 'recipes', 'benchmark.png')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(base64.b64decode(IMAGE.split(',', 1)[1]))
+
+    def run(self, options):
+        ctx = ApiBenchmark().seed({
+            'users': options['users'],
+            'recipes': options['recipes'],
+            'tags': 6,
+            'ingredients_per_recipe': 8,
+            'favorites': 30,
+            'carts': 10,
+            'ingredients_file': options['ingredients_file'],
+        })
+        viewer = ctx['viewer']
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = viewer
+        context = {'request': request}
+
+        recipes = list(
+            Recipe.objects.with_related()
+            .order_by('-id')[:options['page_size']]
+        )
+        authors = list(
+            User.objects.filter(subscribing__user=viewer)
+            .order_by('id')[:options['page_size']]
+        )
+        latest = Recipe.objects.latest_by_author(
+            [author.id for author in authors]
+        )
+        for author in authors:
+            author.latest_recipes = latest[author.id]
+        subscription_recipes = sum(map(len, latest.values()))
+
+        failures = []
+        self.stdout.write(
+            f'{"page":<16}{"image":<10}{"recipes":>8}'
+            f'{"us/recipe":>11}{"bytes/recipe":>14}{"file ops":>10}'
+        )
+        for page, serializer, image_serializer, objects, count in (
+            ('recipes-list', RecipeListSerializer, RecipeListSerializer,
+             recipes, len(recipes)),
+            ('subscriptions', SubscribeSerializer, RecipeBaseSerializer,
+             authors, subscription_recipes),
+        ):
+            for mode in MODES:
+                elapsed, size, file_ops = self.measure(
+                    serializer, image_serializer, objects, context, mode
+                )
+                line = (
+                    f'{page:<16}{mode:<10}{count:>8}'
+                    f'{elapsed / count * 1e6:>11.1f}'
+                    f'{size // count:>14}{file_ops:>10}'
+                )
+                if mode == 'url' and file_ops:
+                    failures.append(line)
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+        return failures
+
+    def measure(self, serializer_class, image_serializer, objects, context,
+                mode):
+        """Медианное время рендеринга страницы и обращения к файлам."""
+        calls = {}
+        patches = [
+            mock.patch.object(
+                FileSystemStorage, method, autospec=True,
+                side_effect=self.counted(calls, method),
+            )
+            for method in STORAGE_METHODS
+        ]
+        patches.append(mock.patch.dict(
+            image_serializer._declared_fields, image=MODES[mode]()
+        ))
+        timings = []
+        for patch in patches:
+            patch.start()
+        try:
+            for _ in range(self.repeat):
+                serializer = serializer_class(
+                    objects, many=True, context=context
+                )
+                start = time.perf_counter()
+                data = serializer.data
+                timings.append(time.perf_counter() - start)
+        finally:
+            for patch in patches:
+                patch.stop()
+        size = len(repr(data).encode())
+        return (
+            statistics.median(timings),
+            size,
+            sum(calls.values()) // self.repeat,
+        )
+
+    def counted(self, calls, method):
+        original = getattr(FileSystemStorage, method)
+
+        def wrapper(*args, **kwargs):
+            calls[method] = calls.get(method, 0) + 1
+            return original(*args, **kwargs)
+        return wrapper
@@ -0,0 +1,95 @@
+import io
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from api.profiling import COLLAPSED, PSTATS, SQL, profile_names
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка сохраненных профилей: самые медленные запросы, горячие '
+        'пути вызовов по выборкам стеков и функции по cProfile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR,
+                            help='Каталог профилей, по умолчанию '
+                                 'PROFILING_DIR')
+        parser.add_argument('--view', help='Только профили маршрута')
+        parser.add_argument('--limit', type=int, default=15)
+        parser.add_argument('--depth', type=int, default=6,
+                            help='Сколько последних вызовов пути показывать')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'])
+        names = [
+            name for name in profile_names(directory)
+            if not options['view']
+            or self.parse(name)[1] == options['view']
+        ]
+        if not names:
+            raise CommandError(f'В {directory} нет профилей')
+        limit = options['limit']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Самые медленные запросы (из {len(names)}):'
+        ))
+        for name in sorted(
+            names, key=lambda name: self.parse(name)[0], reverse=True
+        )[:limit]:
+            with open(directory / f'{name}{SQL}', encoding='utf-8') as file:
+                header = file.readline().lstrip('- ').rstrip()
+                queries = file.readline().lstrip('- ').rstrip()
+            self.stdout.write(f'  {header}, {queries.lower()}  [{name}]')
+
+        paths = Counter()
+        leaves = Counter()
+        for name in names:
+            path = directory / f'{name}{COLLAPSED}'
+            if not path.exists():
+                continue
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    frames = stack.split(';')
+                    paths[' → '.join(frames[-options['depth']:])] += int(
+                        count
+                    )
+                    leaves[frames[-1]] += int(count)
+        total = sum(paths.values())
+        if total:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Горячие пути вызовов ({total} выборок стеков):'
+            ))
+            for path, count in paths.most_common(limit):
+                self.stdout.write(f'  {count / total:6.1%}  {path}')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Функции, в которых выполнялся код:'
+            ))
+            for leaf, count in leaves.most_common(limit):
+                self.stdout.write(f'  {count / total:6.1%}  {leaf}')
+
+        stats_files = [
+            str(directory / f'{name}{PSTATS}') for name in names
+            if (directory / f'{name}{PSTATS}').exists()
+        ]
+        if stats_files:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'cProfile по {len(stats_files)} профилям, по общему '
+                f'времени:'
+            ))
+            stream = io.StringIO()
+            pstats.Stats(*stats_files, stream=stream).sort_stats(
+                'cumulative'
+            ).print_stats(limit)
+            self.stdout.write(stream.getvalue())
+
+    @staticmethod
+    def parse(name):
+        """Время и маршрут из имени <дата>-<время>-<мс>ms-<маршрут>-<id>."""
+        _, _, elapsed, rest = name.split('-', 3)
+        return int(elapsed[:-2]), rest.rsplit('-', 1)[0]
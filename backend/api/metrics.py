@@ -0,0 +1,253 @@
+import contextvars
+import ipaddress
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+TIME_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Имя метрики → (описание, границы корзин). Время, запросы к базе и
+# сериализация считаются только для выборки METRICS_SAMPLE_RATE.
+HISTOGRAMS = {
+    'request_duration_seconds': ('Время обработки запроса', TIME_BUCKETS),
+    'response_bytes': ('Размер ответа', BYTES_BUCKETS),
+    'request_queries': ('Число SQL-запросов (выборка)', QUERY_BUCKETS),
+    'request_db_seconds': ('Время SQL-запросов (выборка)', TIME_BUCKETS),
+    'request_serializer_seconds': (
+        'Время сериализации (выборка)', TIME_BUCKETS
+    ),
+}
+PREFIX = 'foodgram_'
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Запросы к базе и сериализация одного запроса из выборки."""
+
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+def query_wrapper(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def add_query_wrapper(connection, **kwargs):
+    """
+    То же, что connection.execute_wrapper, но для каждого соединения:
+    под ASGI представление может выполняться в другом потоке со своим
+    соединением.
+    """
+    connection.execute_wrappers.append(query_wrapper)
+
+
+class TimedDataMixin:
+    """
+    Время внешнего вызова data сериализатора для запросов из выборки.
+
+    Подмешивается к сериализаторам проекта; вложенные вызовы data
+    внутри уже засекаемого не учитываются повторно.
+    """
+
+    @property
+    def data(self):
+        metrics = current.get()
+        if metrics is None or metrics.serializing:
+            return super().data
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            metrics.serializing = False
+            metrics.serializer_time += time.perf_counter() - start
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """Список с TimedDataMixin для Meta.list_serializer_class."""
+
+
+def install():
+    connection_created.connect(add_query_wrapper)
+
+
+class MetricsRegistry:
+    """
+    Счетчики и гистограммы процесса по имени маршрута и методу.
+
+    Раз в METRICS_FLUSH_INTERVAL секунд процесс сохраняет снимок в кеш
+    Django, а эндпоинт метрик суммирует снимки всех процессов. Процесс
+    занимает слот атомарным cache.add, поэтому одновременные сбросы не
+    затирают друг друга; слот умершего процесса освобождается по TTL.
+    """
+
+    slot_key = 'metrics:slot:{}'
+    snapshot_key = 'metrics:snapshot:{}'
+    process_ttl = 3600
+    max_processes = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+        self.process = f'{socket.gethostname()}:{os.getpid()}'
+        self.slot = None
+
+    def observe(self, view, method, status, duration, size, metrics):
+        values = {
+            'request_duration_seconds': duration,
+            'response_bytes': size,
+        }
+        if metrics is not None:
+            values.update({
+                'request_queries': metrics.queries,
+                'request_db_seconds': metrics.db_time,
+                'request_serializer_seconds': metrics.serializer_time,
+            })
+        with self.lock:
+            self.requests[view, method, status] += 1
+            for name, value in values.items():
+                key = (name, view, method)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    buckets = HISTOGRAMS[name][1]
+                    histogram = self.histograms[key] = [
+                        [0] * (len(buckets) + 1), 0
+                    ]
+                histogram[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+                histogram[1] += value
+        if (
+            time.monotonic() - self.flushed_at
+            > settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'histograms': {
+                    key: (list(counts), total)
+                    for key, (counts, total) in self.histograms.items()
+                },
+            }
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        cache.set(
+            self.snapshot_key.format(self.process), self.snapshot(),
+            self.process_ttl,
+        )
+        self.claim_slot()
+
+    def claim_slot(self):
+        if self.slot is not None:
+            key = self.slot_key.format(self.slot)
+            if cache.get(key) == self.process:
+                cache.touch(key, self.process_ttl)
+                return
+        for slot in range(self.max_processes):
+            if cache.add(
+                self.slot_key.format(slot), self.process, self.process_ttl
+            ):
+                self.slot = slot
+                return
+        self.slot = None
+
+    def collect(self):
+        """Сумма снимков всех процессов, включая текущий."""
+        self.flush()
+        processes = cache.get_many([
+            self.slot_key.format(slot) for slot in range(self.max_processes)
+        ]).values()
+        snapshots = cache.get_many([
+            self.snapshot_key.format(process) for process in processes
+        ])
+        requests = defaultdict(int)
+        histograms = {}
+        for snapshot in snapshots.values():
+            for key, count in snapshot['requests'].items():
+                requests[key] += count
+            for key, (counts, total) in snapshot['histograms'].items():
+                merged = histograms.setdefault(key, [[0] * len(counts), 0])
+                for position, count in enumerate(counts):
+                    merged[0][position] += count
+                merged[1] += total
+        return requests, histograms
+
+
+registry = MetricsRegistry()
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render(requests, histograms):
+    """Текстовый формат Prometheus."""
+    lines = [
+        f'# HELP {PREFIX}requests_total Число запросов',
+        f'# TYPE {PREFIX}requests_total counter',
+    ]
+    for (view, method, status), count in sorted(requests.items()):
+        lines.append(
+            f'{PREFIX}requests_total{{view="{label(view)}",'
+            f'method="{method}",status="{status}"}} {count}'
+        )
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {PREFIX}{name} {description}')
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        for (metric, view, method), (counts, total) in sorted(
+            histograms.items()
+        ):
+            if metric != name:
+                continue
+            labels = f'view="{label(view)}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}{name}_bucket{{{labels},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(f'{PREFIX}{name}_sum{{{labels}}} {total}')
+            lines.append(f'{PREFIX}{name}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def is_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network)
+        for network in settings.METRICS_ALLOWED_NETWORKS
+    )
@@ -0,0 +1,166 @@
+import asyncio
+import random
+import re
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import profiling
+from .authentication import CachedTokenAuthentication
+from .metrics import RequestMetrics, current, registry
+
+SAFE_NAME = re.compile(r'[^\w-]')
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+class AsyncCapableMiddleware:
+    """
+    Основа middleware, которое работает и в синхронной, и в асинхронной
+    цепочке: под ASGI синхронное middleware заставило бы Django
+    выполнять каждый запрос в одном общем потоке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Как в MiddlewareMixin: обработчик должен видеть корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Время, размер ответа и, для доли METRICS_SAMPLE_RATE запросов,
+    число и время SQL-запросов и время сериализации по маршрутам.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.observe(request, response, metrics, start)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.observe(request, response, metrics, start)
+        return response
+
+    def start(self):
+        metrics = None
+        if random.random() < settings.METRICS_SAMPLE_RATE:
+            metrics = RequestMetrics()
+        return metrics, current.set(metrics), time.perf_counter()
+
+    def observe(self, request, response, metrics, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        registry.observe(
+            match.url_name if match and match.url_name else 'unmatched',
+            request.method if request.method in METHODS else 'other',
+            response.status_code,
+            duration,
+            0 if response.streaming else len(response.content),
+            metrics,
+        )
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """
+    Профилирует запрос целиком (cProfile и выборки стеков) по заголовку
+    X-Profile от сотрудника, а при PROFILING_SLOW_MS — снимает выборки
+    стеков у всех запросов и сохраняет профили тех, что медленнее порога.
+    Файлы пишутся в PROFILING_DIR, сводка — команда profile_summary.
+    """
+
+    header = 'X-Profile'
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        deterministic = self.requested(request)
+        if not deterministic and not settings.PROFILING_SLOW_MS:
+            return self.get_response(request)
+        return self.profile(request, deterministic, self.get_response)
+
+    async def __acall__(self, request):
+        deterministic = False
+        if request.headers.get(self.header):
+            deterministic = await sync_to_async(self.requested)(request)
+        if not deterministic and not settings.PROFILING_SLOW_MS:
+            return await self.get_response(request)
+        # Остаток цепочки вызывается из отдельного потока: синхронные
+        # представления выполняются в нем же и попадают в профиль.
+        return await sync_to_async(self.profile, thread_sensitive=False)(
+            request, deterministic, async_to_sync(self.get_response),
+        )
+
+    def profile(self, request, deterministic, get_response):
+        profile = profiling.RequestProfile(deterministic)
+        token = profiling.current.set(profile)
+        profiling.sampler.add(profile)
+        start = time.perf_counter()
+        try:
+            with profile.scope():
+                response = get_response(request)
+        finally:
+            profiling.sampler.discard(profile)
+            profiling.current.reset(token)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not deterministic and elapsed < settings.PROFILING_SLOW_MS:
+            return response
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        name = profiling.save(
+            profile,
+            f'{elapsed:07.0f}ms-{SAFE_NAME.sub("_", view)}',
+            f'{request.method} {request.get_full_path()} '
+            f'{response.status_code} {elapsed:.0f} мс',
+        )
+        if deterministic:
+            response['X-Profile-Id'] = name
+        return response
+
+    def requested(self, request):
+        """Заголовок X-Profile от сотрудника (по сессии или токену)."""
+        if not request.headers.get(self.header):
+            return False
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                result = CachedTokenAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return False
+            user = result[0] if result else None
+        return bool(user and user.is_staff)
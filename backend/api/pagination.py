@@ -1,8 +1,47 @@
-from rest_framework.pagination import PageNumberPagination
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 from rest_framework.response import Response
 from typing_extensions import OrderedDict
 
 
+def estimate_count(queryset):
+    """Приблизительное число строк по статистике планировщика PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PositionEncoder(DjangoJSONEncoder):
+    """Даты без усечения до миллисекунд: позиция курсора должна быть точной."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
 class PageNumberPaginationDataOnly(PageNumberPagination):
     page_size_query_param = 'limit'
 
@@ -10,10 +49,148 @@ class PageNumberPaginationDataOnly(PageNumberPagination):
         return Response(data)
 
 
+class LimitCursorPagination(CursorPagination):
+    """
+    Пагинация по курсору (keyset) в порядке сортировки queryset.
+
+    Сортировка берется из order_by запроса или Meta.ordering модели,
+    по умолчанию — убывание id. Курсор хранит значения всех полей
+    сортировки до id включительно (id добавляется, если его нет), поэтому
+    страницы не пропускают и не повторяют строки с одинаковыми значениями
+    первого поля. Не делает COUNT(*) и OFFSET: count по умолчанию равен
+    null, ?count=exact считает точно, ?count=estimate — по статистике СУБД.
+    """
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    unique_fields = ('id', 'pk')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            self.count = queryset.count()
+        elif mode == 'estimate':
+            self.count = estimate_count(queryset)
+        else:
+            self.count = None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        queryset = queryset.order_by(*(
+            self.reverse_field(field) if reverse else field
+            for field in self.ordering
+        ))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(
+                self.decode_position(self.cursor.position), reverse
+            ))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = self.cursor is not None if not reverse else (
+            has_more
+        )
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering
+            or [self.ordering]
+        )
+        for position, field in enumerate(ordering):
+            if field.lstrip('-') in self.unique_fields:
+                return tuple(ordering[:position + 1])
+        return (*ordering, self.ordering)
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def keyset_filter(self, position, reverse):
+        """Строки после position в порядке сортировки (или до нее)."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def decode_position(self, position):
+        try:
+            position = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_position(self, obj, reverse):
+        position = [
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        ]
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse,
+            position=json.dumps(position, cls=PositionEncoder),
+        ))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
 class CustomLimitPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с переключением на курсорную.
+
+    Курсорный режим включается параметром ?pagination=cursor
+    (или наличием ?cursor=) и сохраняет формат ответа.
+    """
     page_size_query_param = 'limit'
+    mode_query_param = 'pagination'
+    cursor_pagination_class = LimitCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
         return Response(OrderedDict([
             ('count', self.page.paginator.count),
             ('next', self.get_next_link()),
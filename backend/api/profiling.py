@@ -0,0 +1,239 @@
+import contextvars
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.backends.signals import connection_created
+
+current = contextvars.ContextVar('request_profile', default=None)
+
+# Расширения файлов одного профиля.
+COLLAPSED = '.collapsed'
+PSTATS = '.pstats'
+SQL = '.sql'
+
+EXPLAIN = {
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+# Строковые литералы в планах: в них подставлены параметры запроса.
+LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+
+class RequestProfile:
+    """
+    Профиль одного запроса: выборки стеков потоков, которые его
+    обрабатывают, cProfile по ним (если deterministic) и SQL-запросы.
+    """
+
+    def __init__(self, deterministic):
+        self.deterministic = deterministic
+        self.threads = set()
+        self.stacks = Counter()
+        self.profiles = []
+        self.queries = []
+
+    @contextmanager
+    def scope(self):
+        """Профилирует код текущего потока."""
+        thread_id = threading.get_ident()
+        self.threads.add(thread_id)
+        profile = None
+        if self.deterministic:
+            profile = cProfile.Profile()
+            self.profiles.append(profile)
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.threads.discard(thread_id)
+
+
+def thread_scope():
+    """Профилирует текущий поток, если запрос профилируется."""
+    profile = current.get()
+    return nullcontext() if profile is None else profile.scope()
+
+
+class Sampler:
+    """
+    Поток, который раз в PROFILING_INTERVAL секунд снимает стеки всех
+    профилируемых запросов. Пока таких запросов нет, поток спит.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = set()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.labels = {}
+
+    def add(self, profile):
+        with self.lock:
+            self.profiles.add(profile)
+            self.wakeup.set()
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='profiler', daemon=True
+                )
+                self.thread.start()
+
+    def discard(self, profile):
+        with self.lock:
+            self.profiles.discard(profile)
+            if not self.profiles:
+                self.wakeup.clear()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(settings.PROFILING_INTERVAL)
+            frames = sys._current_frames()
+            for profile in list(self.profiles):
+                for thread_id in list(profile.threads):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.stacks[self.collapse(frame)] += 1
+
+    def collapse(self, frame):
+        """Стек в формате collapsed: от внешнего вызова к текущему."""
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = self.labels[code] = (
+                    f'{code.co_name} ({short_path(code.co_filename)}:'
+                    f'{code.co_firstlineno})'
+                ).replace(';', ',')
+            labels.append(label)
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+
+sampler = Sampler()
+
+
+def short_path(filename):
+    for prefix in (str(settings.BASE_DIR), *sys.path):
+        if prefix and filename.startswith(prefix):
+            return filename[len(prefix):].lstrip(os.sep)
+    return filename
+
+
+def query_wrapper(execute, sql, params, many, context):
+    profile = current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries.append((
+            context['connection'].alias, sql, params, many,
+            time.perf_counter() - start,
+        ))
+
+
+def add_query_wrapper(connection, **kwargs):
+    connection.execute_wrappers.append(query_wrapper)
+
+
+def install():
+    connection_created.connect(add_query_wrapper)
+
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    prefix = EXPLAIN.get(connection.vendor)
+    if prefix is None:
+        return ''
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(
+                ' '.join(str(value) for value in row)
+                for row in cursor.fetchall()
+            )
+    except DatabaseError as error:
+        return f'EXPLAIN не выполнен: {error}'
+
+
+def format_queries(profile, header):
+    """
+    SQL-запросы по убыванию времени, с планами самых медленных.
+
+    Значения параметров на диск не пишутся: среди них ключи токенов и
+    хеши паролей. В планах строковые литералы заменяются на '?'.
+    """
+    lines = [f'-- {header}', f'-- Запросов: {len(profile.queries)}', '']
+    explained = set()
+    for alias, sql, params, many, duration in sorted(
+        profile.queries, key=lambda query: -query[-1]
+    ):
+        lines.append(f'-- {duration * 1000:.2f} мс, {alias}')
+        lines.append(f'{sql};')
+        if params:
+            lines.append(f'-- параметров: {len(params)}')
+        if (
+            not many and sql not in explained
+            and len(explained) < settings.PROFILING_EXPLAIN_LIMIT
+            and sql.lstrip()[:6].upper() == 'SELECT'
+        ):
+            explained.add(sql)
+            lines.extend(
+                '--   ' + LITERAL.sub("'?'", line)
+                for line in explain(alias, sql, params).splitlines()
+            )
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def save(profile, name, header):
+    """Записывает файлы профиля и удаляет самые старые профили."""
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{uuid.uuid4().hex[:6]}'
+    base = directory / name
+    with open(base.with_suffix(COLLAPSED), 'w', encoding='utf-8') as file:
+        for stack, count in profile.stacks.most_common():
+            file.write(f'{stack} {count}\n')
+    if profile.profiles:
+        stats = pstats.Stats(profile.profiles[0])
+        for other in profile.profiles[1:]:
+            stats.add(other)
+        stats.dump_stats(base.with_suffix(PSTATS))
+    with open(base.with_suffix(SQL), 'w', encoding='utf-8') as file:
+        file.write(format_queries(profile, header))
+    prune(directory, settings.PROFILING_KEEP)
+    return name
+
+
+def profile_names(directory):
+    """Имена профилей каталога от старых к новым."""
+    return sorted({
+        path.stem for path in Path(directory).glob(f'*{SQL}')
+    })
+
+
+def prune(directory, keep):
+    names = profile_names(directory)
+    for name in names[:max(len(names) - keep, 0)]:
+        for suffix in (COLLAPSED, PSTATS, SQL):
+            try:
+                (Path(directory) / name).with_suffix(suffix).unlink()
+            except FileNotFoundError:
+                pass
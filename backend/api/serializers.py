@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import F
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
@@ -8,14 +9,66 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.fields import IntegerField, SerializerMethodField
 
 from recipes.models import (Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+                            Recipe, ShoppingCartIngredient, Tag)
+from recipes.matching import recipe_matcher
+from recipes.search import recipe_search
 from users.models import Subscribe
 
+from .metrics import TimedDataMixin, TimedListSerializer
+from .viewer import ViewerState
+
 User = get_user_model()
 
 
-class RecipeBaseSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+class StorageURLField(serializers.Field):
+    """
+    Ссылки на файлы рецепта только для чтения.
+
+    URL строится по имени файла через storage.url(), без открытия
+    и проверки файла; адрес сайта берется из запроса один раз.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.storage = Recipe._meta.get_field('image').storage
+        self.request = None
+        self.base_url = ''
+
+    def build_url(self, name):
+        url = self.storage.url(name)
+        request = self.context.get('request')
+        if request is None or not url.startswith('/'):
+            return url
+        if request is not self.request:
+            self.request = request
+            self.base_url = request.build_absolute_uri('/')[:-1]
+        return self.base_url + url
+
+
+class ImageURLField(StorageURLField):
+    """Ссылка на изображение вместо Base64ImageField на чтении."""
+
+    def to_representation(self, value):
+        return self.build_url(value.name) if value else None
+
+
+class ImageVariantsField(StorageURLField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_variants')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return {
+            variant: self.build_url(name) for variant, name in value.items()
+        }
+
+
+class RecipeBaseSerializer(TimedDataMixin, serializers.ModelSerializer):
+    image = ImageURLField()
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -23,14 +76,47 @@ class RecipeBaseSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
 
-class CustomUserSerializer(UserCreateSerializer):
+class ViewerStateListSerializer(TimedListSerializer):
+    """Загружает ViewerState для всей страницы перед рендерингом."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.preload_viewer_state(
+            ViewerState.for_context(self.context), items
+        )
+        return super().to_representation(items)
+
+
+class ViewerStateMixin:
+    """
+    Флаги текущего пользователя из общего ViewerState.
+
+    Страница загружается через ViewerStateListSerializer, отдельный
+    объект — одним запросом перед рендерингом.
+    """
+
+    def preload_viewer_state(self, viewer, objects):
+        pass
+
+    def to_representation(self, instance):
+        if self.parent is None:
+            self.preload_viewer_state(
+                ViewerState.for_context(self.context), [instance]
+            )
+        return super().to_representation(instance)
+
+
+class CustomUserSerializer(TimedDataMixin, ViewerStateMixin,
+                           UserCreateSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
+        list_serializer_class = ViewerStateListSerializer
         model = User
         fields = (
             'email',
@@ -42,16 +128,28 @@ class CustomUserSerializer(UserCreateSerializer):
             'is_subscribed',
         )
 
+    def preload_viewer_state(self, viewer, users):
+        viewer.preload(authors=users)
+
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(user=user, author=obj).exists()
+        return ViewerState.for_context(self.context).is_subscribed(obj)
+
+
+def get_recipes_limit(request):
+    """Значение ?recipes_limit= или None, если ограничения нет."""
+    limit = request.query_params.get('recipes_limit')
+    if not limit:
+        return None
+    if not limit.isdigit():
+        raise ValidationError(
+            {'recipes_limit': 'Укажите неотрицательное целое число'}
+        )
+    return int(limit)
 
 
 class SubscribeSerializer(CustomUserSerializer):
     recipes_count = SerializerMethodField()
-    recipes = RecipeBaseSerializer(many=True, read_only=True)
+    recipes = SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = (
@@ -90,32 +188,38 @@ class SubscribeSerializer(CustomUserSerializer):
             )
         return data
 
+    def preload_viewer_state(self, viewer, users):
+        """Подписка на автора известна заранее."""
+
     def get_is_subscribed(*args):
         return True
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = RecipeBaseSerializer(recipes, many=True, read_only=True)
-        return serializer.data
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = Recipe.objects.latest_by_author(
+                [obj.id], get_recipes_limit(self.context['request'])
+            )[obj.id]
+        return RecipeBaseSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedDataMixin, serializers.ModelSerializer):
 
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = Tag
         fields = ('id', 'name', 'slug', 'color')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedDataMixin, serializers.ModelSerializer):
 
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = Ingredient
         fields = ('id', 'name', 'measurement_unit')
 
@@ -137,38 +241,44 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('amount', 'name', 'measurement_unit', 'id')
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(TimedDataMixin, ViewerStateMixin,
+                           serializers.ModelSerializer):
     """Получение списка рецептов."""
     tags = TagSerializer(
         many=True,
         read_only=True,
     )
     ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = ImageURLField()
+    images = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
     author = CustomUserSerializer(read_only=True)
 
     def get_ingredients(self, recipe):
-
-        ingredients = recipe.ingredients.values(
-            "id", "name", "measurement_unit", amount=F("recipe__amount")
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredient.all()
+        ]
+
+    def preload_viewer_state(self, viewer, recipes):
+        viewer.preload(
+            recipes=recipes, authors=[recipe.author for recipe in recipes]
         )
-        return ingredients
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(recipe=obj).exists()
+        return ViewerState.for_context(self.context).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.shopping_cart.filter(recipe=obj).exists()
+        return ViewerState.for_context(self.context).is_in_shopping_cart(obj)
 
     class Meta:
+        list_serializer_class = ViewerStateListSerializer
         model = Recipe
         fields = (
             'id',
@@ -179,11 +289,39 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'author',
             'is_in_shopping_cart',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
 
 
+class MatchQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+    ingredients = serializers.ListField(
+        child=IntegerField(min_value=1), min_length=1,
+    )
+    tags = serializers.ListField(
+        child=serializers.SlugField(), required=False,
+    )
+    max_time = IntegerField(min_value=1, required=False)
+    max_missing = IntegerField(min_value=0, required=False)
+    limit = IntegerField(
+        min_value=1, max_value=settings.RECIPE_MATCH_LIMIT, default=20,
+    )
+
+
+class MatchedRecipeSerializer(RecipeListSerializer):
+    """Рецепт с числом совпавших и недостающих ингредиентов."""
+    matched_ingredients = IntegerField(source='matched', read_only=True)
+    missing_ingredients = IntegerField(source='missing', read_only=True)
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + (
+            'matched_ingredients',
+            'missing_ingredients',
+        )
+
+
 class IngredientRecipeCreateUpdateSerializer(serializers.ModelSerializer):
     id = IntegerField(write_only=True)
 
@@ -192,28 +330,29 @@ class IngredientRecipeCreateUpdateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
+class RecipeCreateUpdateSerializer(TimedDataMixin, ViewerStateMixin,
+                                   serializers.ModelSerializer):
     ingredients = IngredientRecipeCreateUpdateSerializer(many=True)
     tags = TagSerializer(
         many=True,
         read_only=True,
     )
     image = Base64ImageField()
+    images = ImageVariantsField()
     author = CustomUserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
+    def preload_viewer_state(self, viewer, recipes):
+        viewer.preload(
+            recipes=recipes, authors=[recipe.author for recipe in recipes]
+        )
+
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(recipe=obj).exists()
+        return ViewerState.for_context(self.context).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return user.shopping_cart.filter(recipe=obj).exists()
+        return ViewerState.for_context(self.context).is_in_shopping_cart(obj)
 
     def validate(self, data):
         ingredients = self.initial_data.get('ingredients')
@@ -236,21 +375,27 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         ingredients_list = []
 
         for i in ingredients:
-            if i["id"] in ingredients_list:
+            if int(i["id"]) in ingredients_list:
                 raise serializers.ValidationError(
                     'Ингредиенты не могут повторяться'
                 )
             if int(i['amount']) < 0:
                 raise serializers.ValidationError(
                     'Количество ингредиента не может равняться нулю')
-            ingredients_list.append(i["id"])
+            ingredients_list.append(int(i["id"]))
 
-        ingredients_exist = Ingredient.objects.filter(id__in=ingredients_list)
+        ingredients_exist = Ingredient.objects.in_bulk(ingredients_list)
 
         if len(ingredients_exist) != len(ingredients_list):
             raise ValidationError('Указан несуществующий ингредиент')
 
-        data['ingredients'] = ingredients
+        data['ingredients'] = [
+            {
+                'ingredient': ingredients_exist[ingredient_id],
+                'amount': int(i['amount']),
+            }
+            for ingredient_id, i in zip(ingredients_list, ingredients)
+        ]
         data['tags'] = tags
         return data
 
@@ -258,12 +403,13 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
         IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
 
         image = validated_data.pop('image')
@@ -272,32 +418,61 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(image=image, **validated_data)
         recipe.tags.set(tags)
         self.recipe_ingredients_set(recipe=recipe, ingredients=ingredients)
+        recipe_search.refresh([recipe.id])
+        recipe_matcher.changed([recipe.id])
 
         return recipe
 
+    def recipe_ingredients_update(self, recipe, ingredients):
+        """Обновляет состав рецепта, меняя только отличающиеся строки."""
+        current = {row.ingredient_id: row for row in recipe.ingredient.all()}
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in current.items()
+        }
+        new_amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = current.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+
+        removed = current.keys() - new_amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.recipe_ingredients_set(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].id not in current
+        ])
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe, old_amounts, new_amounts
+        )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         if ingredients is not None:
-            instance.ingredients.clear()
-
-            create_ingredients = [
-                IngredientRecipe(
-                    recipe=instance,
-                    ingredient=Ingredient.objects.get(id=ingredient['id']),
-                    amount=ingredient['amount']
-                )
-                for ingredient in ingredients
-            ]
-            IngredientRecipe.objects.bulk_create(
-                create_ingredients
-            )
-        return super().update(instance, validated_data)
+            self.recipe_ingredients_update(instance, ingredients)
+        recipe = super().update(instance, validated_data)
+        recipe_search.refresh([recipe.id])
+        recipe_matcher.changed([recipe.id])
+        return recipe
 
     def to_representation(self, obj):
         self.fields.pop('ingredients')
         representation = super().to_representation(obj)
         representation['ingredients'] = IngredientRecipeSerializer(
-            IngredientRecipe.objects.filter(recipe=obj).all(), many=True
+            IngredientRecipe.objects.filter(
+                recipe=obj
+            ).select_related('ingredient'),
+            many=True
         ).data
         return representation
 
@@ -306,6 +481,7 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         fields = (
             'id',
             'image',
+            'images',
             'name',
             'ingredients',
             'tags',
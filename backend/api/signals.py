@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import variants_ready
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+
+from .authentication import token_cache
+from .cache import catalog_cache, response_cache
+
+User = get_user_model()
+
+
+def invalidate_on_commit(*tags):
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+def invalidate_recipes(*recipe_ids):
+    invalidate_on_commit(
+        'recipes', *(f'recipe:{recipe_id}' for recipe_id in recipe_ids)
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_catalog(**kwargs):
+    # Только после фиксации: иначе параллельное чтение успеет положить
+    # в кеш данные до фиксации уже под новой версией.
+    transaction.on_commit(catalog_cache.bump)
+    invalidate_on_commit('catalog')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver(variants_ready, sender=Recipe)
+def invalidate_recipe_images(recipe_ids, **kwargs):
+    invalidate_recipes(*recipe_ids)
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidate_recipes(*(pk_set or ()))
+    else:
+        invalidate_recipes(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(instance, **kwargs):
+    invalidate_on_commit(f'user:{instance.pk}')
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_delete, sender=User)
+def invalidate_tokens(**kwargs):
+    transaction.on_commit(token_cache.bump)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(created, update_fields=None, **kwargs):
+    # У нового пользователя нет токенов, а вход обновляет только
+    # last_login — кешированный пользователь от этого не устаревает.
+    if created:
+        return
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        transaction.on_commit(token_cache.bump)
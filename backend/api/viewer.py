@@ -0,0 +1,99 @@
+from django.db.models import IntegerField, Value
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe
+
+SUBSCRIBED = 0
+FAVORITED = 1
+IN_CART = 2
+
+
+class ViewerState:
+    """
+    Подписки, избранное и корзина текущего пользователя.
+
+    Один объект на запрос, общий для всех сериализаторов ответа. Данные
+    загружаются пачкой только для объектов страницы; объект, которого не
+    было на странице, догружается отдельным запросом.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.authors = set()
+        self.subscribed = set()
+        self.recipes = set()
+        self.favorited = set()
+        self.in_cart = set()
+
+    @classmethod
+    def for_context(cls, context):
+        request = context.get('request')
+        if request is None:
+            return cls(None)
+        state = getattr(request, 'viewer_state', None)
+        if state is None or state.user is not request.user:
+            state = request.viewer_state = cls(request.user)
+        return state
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def load(self, recipe_ids=(), author_ids=()):
+        """Догружает состояние одним запросом UNION ALL."""
+        recipe_ids = set(recipe_ids) - self.recipes
+        author_ids = set(author_ids) - self.authors - {self.user.pk}
+        queries = []
+        if author_ids:
+            queries.append(Subscribe.objects.filter(
+                user=self.user, author_id__in=author_ids
+            ).values_list(
+                Value(SUBSCRIBED, IntegerField()), 'author_id'
+            ).order_by())
+        if recipe_ids:
+            for kind, model in (
+                (FAVORITED, Favorite), (IN_CART, ShoppingCart)
+            ):
+                queries.append(model.objects.filter(
+                    user=self.user, recipe_id__in=recipe_ids
+                ).values_list(
+                    Value(kind, IntegerField()), 'recipe_id'
+                ).order_by())
+        if not queries:
+            return
+        found = {
+            SUBSCRIBED: self.subscribed,
+            FAVORITED: self.favorited,
+            IN_CART: self.in_cart,
+        }
+        for kind, pk in queries[0].union(*queries[1:], all=True):
+            found[kind].add(pk)
+        self.recipes |= recipe_ids
+        self.authors |= author_ids
+
+    def preload(self, recipes=(), authors=()):
+        """Загружает состояние для всех объектов страницы сразу."""
+        if self.is_anonymous:
+            return
+        self.load(
+            recipe_ids=[recipe.pk for recipe in recipes],
+            author_ids=[author.pk for author in authors],
+        )
+
+    def is_subscribed(self, author):
+        if self.is_anonymous:
+            return False
+        self.load(author_ids=[author.pk])
+        return author.pk in self.subscribed
+
+    def is_favorited(self, recipe):
+        if self.is_anonymous:
+            return False
+        self.load(recipe_ids=[recipe.pk])
+        return recipe.pk in self.favorited
+
+    def is_in_shopping_cart(self, recipe):
+        if self.is_anonymous:
+            return False
+        self.load(recipe_ids=[recipe.pk])
+        return recipe.pk in self.in_cart
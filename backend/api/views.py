@@ -1,34 +1,43 @@
 from datetime import datetime
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import (HttpResponse, HttpResponseForbidden,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import (
-    IsAuthenticatedOrReadOnly, SAFE_METHODS, IsAuthenticated)
+    AllowAny, IsAuthenticatedOrReadOnly, SAFE_METHODS, IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from recipes.models import (Recipe, Tag, Ingredient,
-                            IngredientRecipe, ShoppingCart, Favorite)
+from recipes.counters import (RECIPE_CARTS, RECIPE_FAVORITES, USER_RECIPES,
+                              delete_counted)
+from recipes.matching import recipe_matcher
+from recipes.models import (RECIPE_ORDERINGS, Recipe, Tag, Ingredient,
+                            ShoppingCart, ShoppingCartIngredient, Favorite)
+from .cache import AnonymousResponseCacheMixin, CatalogCacheMixin
+from .exporters import RENDERERS
 from .filters import IngredientFilter, RecipeFilter
+from .metrics import is_allowed, registry, render
 from .pagination import CustomLimitPagination, PageNumberPaginationDataOnly
 from .permissions import IsOwnerOrReadOnly
 from .serializers import (
     RecipeListSerializer, RecipeCreateUpdateSerializer,
-    IngredientSerializer, TagSerializer, RecipeBaseSerializer)
+    IngredientSerializer, TagSerializer, RecipeBaseSerializer,
+    MatchQuerySerializer, MatchedRecipeSerializer)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = PageNumberPaginationDataOnly
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -36,16 +45,34 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     pagination_class = PageNumberPaginationDataOnly
 
 
-class RecipesViewSet(ModelViewSet):
+class RecipesViewSet(AnonymousResponseCacheMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly)
     pagination_class = CustomLimitPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.with_related()
+        return Recipe.objects.all()
+
+    def get_cache_tags(self, data):
+        if self.action == 'retrieve':
+            return {f'recipe:{data["id"]}', f'user:{data["author"]["id"]}'}
+        return {
+            f'user:{recipe["author"]["id"]}' for recipe in data['results']
+        }
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_destroy(self, instance):
+        delete_counted(
+            USER_RECIPES, instance.author_id,
+            Recipe.objects.filter(pk=instance.pk),
+        )
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
@@ -61,10 +88,10 @@ class RecipesViewSet(ModelViewSet):
         serializer = RecipeBaseSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete_obj(self, model, user, pk):
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+    def delete_obj(self, model, user, pk, counter):
+        if delete_counted(
+            counter, pk, model.objects.filter(user=user, recipe__id=pk)
+        ):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({
             'errors': 'Рецепт уже удален'
@@ -75,22 +102,115 @@ class RecipesViewSet(ModelViewSet):
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         if request.method == 'POST':
             return self.add_obj(Favorite, request.user, pk)
         else:
-            return self.delete_obj(Favorite, request.user, pk)
+            return self.delete_obj(
+                Favorite, request.user, pk, RECIPE_FAVORITES
+            )
 
     @action(
         detail=True,
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         if request.method == 'POST':
-            return self.add_obj(ShoppingCart, request.user, pk)
+            response = self.add_obj(ShoppingCart, request.user, pk)
+            if response.status_code == status.HTTP_201_CREATED:
+                ShoppingCartIngredient.objects.add_recipe(request.user, pk)
         else:
-            return self.delete_obj(ShoppingCart, request.user, pk)
+            response = self.delete_obj(
+                ShoppingCart, request.user, pk, RECIPE_CARTS
+            )
+            if response.status_code == status.HTTP_204_NO_CONTENT:
+                ShoppingCartIngredient.objects.remove_recipe(
+                    request.user, pk
+                )
+        return response
+
+    @action(
+        detail=False,
+        permission_classes=[AllowAny]
+    )
+    def match(self, request):
+        """Рецепты, которые можно приготовить из данных ингредиентов."""
+        params = MatchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        tag_ids = None
+        if 'tags' in query:
+            tag_ids = list(Tag.objects.filter(
+                slug__in=query['tags']
+            ).values_list('id', flat=True))
+        found = recipe_matcher.match(
+            query['ingredients'],
+            query['limit'],
+            max_time=query.get('max_time'),
+            tag_ids=tag_ids,
+            max_missing=query.get('max_missing'),
+        )
+        recipes = Recipe.objects.with_related().in_bulk(
+            [recipe_id for recipe_id, _, _ in found]
+        )
+        results = []
+        for recipe_id, matched, missing in found:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched = matched
+                recipe.missing = missing
+                results.append(recipe)
+        serializer = MatchedRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=True,
+        permission_classes=[AllowAny]
+    )
+    def similar(self, request, pk):
+        """Похожие рецепты из таблицы, построенной build_recommendations."""
+        recipes = list(
+            Recipe.objects.with_related()
+            .filter(neighbor_of__recipe_id=pk)
+            .order_by('neighbor_of__position')
+        )
+        if not recipes:
+            get_object_or_404(Recipe, id=pk)
+        serializer = RecipeListSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated]
+    )
+    def recommended(self, request):
+        """
+        Персональная лента рекомендаций; пока ее нет — популярные
+        рецепты других авторов.
+        """
+        user = request.user
+        if user.recommendations.exists():
+            queryset = Recipe.objects.with_related().filter(
+                recommended_for__user=user
+            ).annotate(
+                recommendation_position=F('recommended_for__position')
+            ).order_by('recommendation_position')
+        else:
+            queryset = Recipe.objects.with_related().exclude(
+                author=user
+            ).order_by(*RECIPE_ORDERINGS['popular'])
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeListSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
 
     @action(
         detail=False,
@@ -100,29 +220,32 @@ class RecipesViewSet(ModelViewSet):
         user = request.user
         if not user.shopping_cart.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
+        renderer = RENDERERS.get(request.query_params.get('type', 'txt'))
+        if renderer is None:
+            return Response({
+                'errors': f'Доступные форматы: {", ".join(RENDERERS)}'
+            }, status=HTTP_400_BAD_REQUEST)
+
+        ingredients = user.cart_ingredients.values(
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name', 'measurement_unit')
+
+        response = StreamingHttpResponse(
+            renderer().render(user, ingredients.iterator(), datetime.today()),
+            content_type=renderer.content_type,
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{renderer.extension}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
-
         return response
+
+
+def metrics(request):
+    """Метрики всех процессов в формате Prometheus для локального сбора."""
+    if not is_allowed(request.META.get('REMOTE_ADDR')):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render(*registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
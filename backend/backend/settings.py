@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Project custom apps
     'recipes.apps.RecipesConfig',
@@ -35,6 +36,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -42,6 +44,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -86,6 +89,23 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Версии для сброса кешей каталога, ответов, токенов и индекса подбора
+# хранятся в кеше Django: с кешем в памяти процесса другие процессы
+# сброса не видят. Несколько воркеров требуют общего кеша (gunicorn.conf.py).
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -134,7 +154,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomLimitPagination',
@@ -159,3 +179,95 @@ DJOSER = {
         "user_create": "api.serializers.CustomUserSerializer",
     },
 }
+
+# Ingredient search settings
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+INGREDIENT_SEARCH_TTL = int(os.getenv('INGREDIENT_SEARCH_TTL', 300))
+INGREDIENT_SEARCH_CACHE_SIZE = 1024
+
+# Recipe search settings
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+RECIPE_SEARCH_TTL = int(os.getenv('RECIPE_SEARCH_TTL', 300))
+
+# Recipe matching settings
+
+RECIPE_MATCH_TTL = int(os.getenv('RECIPE_MATCH_TTL', 3600))
+RECIPE_MATCH_MAX_CHANGES = 500
+RECIPE_MATCH_LIMIT = 100
+
+# Async serving settings
+
+# Под ASGI включается в backend/asgi.py; потоков не больше, чем
+# соединений с базой, которые может выдержать один процесс.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
+ASYNC_READ_THREADS = int(os.getenv('ASYNC_READ_THREADS', 8))
+
+# Metrics settings
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128'
+).split(',')
+
+# Profiling settings
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+# Порог в мс для автоматического профилирования; 0 — только по заголовку.
+PROFILING_SLOW_MS = int(os.getenv('PROFILING_SLOW_MS', 0))
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+PROFILING_DIR = os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')
+PROFILING_KEEP = int(os.getenv('PROFILING_KEEP', 200))
+PROFILING_EXPLAIN_LIMIT = 10
+
+# Token cache settings
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', 'false').lower() == 'true'
+
+# Recommendation settings
+
+RECOMMENDATION_WEIGHTS = {
+    'favorites': 1.0,
+    'carts': 0.5,
+    'ingredients': 0.3,
+    'tags': 0.1,
+}
+RECOMMENDATION_MAX_DF = 0.05
+RECOMMENDATION_CANDIDATES = int(
+    os.getenv('RECOMMENDATION_CANDIDATES', 1000)
+)
+RECOMMENDATION_NEIGHBORS = int(os.getenv('RECOMMENDATION_NEIGHBORS', 20))
+RECOMMENDATION_FEED_SIZE = int(os.getenv('RECOMMENDATION_FEED_SIZE', 100))
+
+# Catalog cache settings
+
+CATALOG_CACHE_SIZE = int(os.getenv('CATALOG_CACHE_SIZE', 2048))
+
+# Anonymous response cache settings
+
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Shopping list export settings
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Recipe image settings
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_VARIANTS = {
+    'thumbnail': 320,
+    'medium': 960,
+}
+IMAGE_VARIANT_QUALITY = 80
+
+# Recipe ordering settings
+
+TRENDING_DAYS = int(os.getenv('TRENDING_DAYS', 7))
@@ -0,0 +1,34 @@
+"""
+Настройки gunicorn: SERVER_MODE=wsgi (по умолчанию) — синхронные
+воркеры и backend.wsgi, SERVER_MODE=asgi — воркеры uvicorn и
+backend.asgi. Число воркеров одинаково в обоих режимах.
+
+Сброс кешей между воркерами идет через кеш Django, поэтому больше
+одного воркера можно запустить только с общим CACHE_BACKEND
+(Redis, Memcached, файлы или база).
+"""
+import os
+
+# То же, что LOCAL_CACHE_BACKENDS в settings.py: настройки Django здесь
+# еще не загружены.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if workers > 1 and os.getenv(
+    'CACHE_BACKEND', LOCAL_CACHE_BACKENDS[0]
+) in LOCAL_CACHE_BACKENDS:
+    raise RuntimeError(
+        f'GUNICORN_WORKERS={workers} требует общего CACHE_BACKEND: '
+        'с кешем в памяти процесса воркеры не видят сброс кешей'
+    )
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
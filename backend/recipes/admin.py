@@ -1,13 +1,32 @@
 from django.contrib import admin
 
+from .counters import (RECIPE_CARTS, RECIPE_FAVORITES, USER_RECIPES,
+                       parent_pks, recount)
 from .models import (
     Recipe, Ingredient, Tag,
     Favorite, ShoppingCart,
 )
+from .matching import recipe_matcher
+from .search import recipe_search
+
+
+class CountedDeleteMixin:
+    """Пересчитывает счетчик родителей строк, удаленных в админке."""
+
+    counter = None
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        pks = parent_pks(self.counter, queryset)
+        super().delete_queryset(request, queryset)
+        recount(self.counter, pks)
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(CountedDeleteMixin, admin.ModelAdmin):
+    counter = USER_RECIPES
     list_display = (
         "name",
         "author",
@@ -23,9 +42,14 @@ class RecipeAdmin(admin.ModelAdmin):
 
     admin.site.empty_value_display = "Не задано"
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipe_search.refresh([form.instance.pk])
+        recipe_matcher.changed([form.instance.pk])
+
     @admin.display(description='Добавили в избранное')
     def in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
@@ -55,14 +79,16 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(CountedDeleteMixin, admin.ModelAdmin):
+    counter = RECIPE_CARTS
     list_display = ('user', 'recipe',)
 
     admin.site.empty_value_display = "Не задано"
 
 
 @admin.register(Favorite)
-class FavouriteAdmin(admin.ModelAdmin):
+class FavouriteAdmin(CountedDeleteMixin, admin.ModelAdmin):
+    counter = RECIPE_FAVORITES
     list_display = ('user', 'recipe',)
 
     admin.site.empty_value_display = "Не задано"
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribe, User
+
+from .models import Favorite, Recipe, ShoppingCart
+
+Counter = namedtuple('Counter', ('model', 'field', 'related', 'key'))
+
+# Счетчик model.field равен числу строк related, у которых key = pk.
+RECIPE_FAVORITES = Counter(Recipe, 'favorites_count', Favorite, 'recipe')
+RECIPE_CARTS = Counter(Recipe, 'in_carts_count', ShoppingCart, 'recipe')
+USER_RECIPES = Counter(User, 'recipes_count', Recipe, 'author')
+USER_SUBSCRIBERS = Counter(User, 'subscribers_count', Subscribe, 'author')
+COUNTERS = (RECIPE_FAVORITES, RECIPE_CARTS, USER_RECIPES, USER_SUBSCRIBERS)
+
+
+def change_counter(counter, pk, delta):
+    """Атомарно меняет счетчик одним UPDATE с F()."""
+    counter.model.objects.filter(pk=pk).update(**{
+        counter.field: Greatest(F(counter.field) + delta, 0)
+    })
+
+
+def expected_count(counter):
+    return Coalesce(Subquery(
+        counter.related.objects.filter(**{counter.key: OuterRef('pk')})
+        .order_by().values(counter.key)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def find_drift(counter, pks=None):
+    """Строки, где счетчик расходится с фактом: [(pk, было, должно)]."""
+    queryset = counter.model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    return list(
+        queryset.annotate(expected=expected_count(counter))
+        .exclude(**{counter.field: F('expected')})
+        .order_by('pk').values_list('pk', counter.field, 'expected')
+    )
+
+
+def recount(counter, pks=None):
+    """Пересчитывает счетчик для pks (или всех строк) одним UPDATE."""
+    queryset = counter.model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    return queryset.update(**{counter.field: expected_count(counter)})
+
+
+def delete_counted(counter, pk, queryset):
+    """
+    Удаляет строки counter.related с key = pk и уменьшает счетчик на
+    число строк, которые удалил именно этот запрос: если ту же строку
+    одновременно удаляет другой запрос, delete() одного из них вернет 0.
+    """
+    deleted = queryset.delete()[1].get(counter.related._meta.label, 0)
+    if deleted:
+        change_counter(counter, pk, -deleted)
+    return deleted
+
+
+def parent_pks(counter, queryset):
+    """Ключи родителей строк queryset модели counter.related."""
+    return set(queryset.values_list(counter.key, flat=True))
+
+
+def counter_receiver(counter):
+    """
+    Увеличивает счетчик при создании строки. Удаления счетчики меняют
+    явно (delete_counted, recount), а не по post_delete: сигнал
+    приходит и для строки, которую уже удалил другой запрос, и для
+    каждой строки каскада отдельно.
+    """
+    key = f'{counter.key}_id'
+
+    def created(instance, created, raw=False, **kwargs):
+        if created and not raw:
+            change_counter(counter, getattr(instance, key), 1)
+
+    return created
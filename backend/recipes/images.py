@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Отправляется после записи вариантов в рецепты, аргумент recipe_ids.
+variants_ready = Signal()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, где имя файла — sha256 его содержимого.
+
+    Одинаковые загрузки ссылаются на один файл:
+    recipes/ab/abcdef….png, повторная запись не выполняется.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        path = PurePosixPath(name)
+        hexdigest = digest.hexdigest()
+        return str(
+            path.parent / hexdigest[:2] / f'{hexdigest}{path.suffix.lower()}'
+        )
+
+    def store(self, name, content):
+        """Атомарно записывает файл под точным именем name."""
+        if not self.exists(name):
+            temporary = super()._save(f'{name}.{uuid.uuid4().hex}', content)
+            os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def _save(self, name, content):
+        name = self.store(self.hashed_name(name, content), content)
+        schedule_variants(name)
+        return name
+
+
+def variant_name(name, variant):
+    path = PurePosixPath(name)
+    return str(path.with_name(f'{path.stem}.{variant}.webp'))
+
+
+def variant_names(name):
+    """Ожидаемые имена всех вариантов изображения name."""
+    if not name:
+        return {}
+    return {
+        variant: variant_name(name, variant)
+        for variant in settings.IMAGE_VARIANTS
+    }
+
+
+def build_variants(name):
+    """Создает недостающие варианты и записывает их в рецепты."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    storage = Recipe._meta.get_field('image').storage
+    variants = variant_names(name)
+    image = None
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        if storage.exists(variants[variant]):
+            continue
+        if image is None:
+            with storage.open(name) as file:
+                image = Image.open(file)
+                image.load()
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+        resized = image.copy()
+        resized.thumbnail((size, size))
+        buffer = BytesIO()
+        resized.save(
+            buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY
+        )
+        storage.store(variants[variant], ContentFile(buffer.getvalue()))
+    recipes = Recipe.objects.filter(image=name)
+    recipe_ids = list(recipes.values_list('id', flat=True))
+    recipes.update(image_variants=variants)
+    variants_ready.send(sender=Recipe, recipe_ids=recipe_ids)
+    return variants
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def process_variants(name):
+    close_old_connections()
+    try:
+        return build_variants(name)
+    except FileNotFoundError:
+        logger.warning('Изображение %s не найдено', name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(name):
+    """Ставит обработку изображения в фоновый пул после коммита."""
+    transaction.on_commit(
+        lambda: get_executor().submit(process_variants, name)
+    )
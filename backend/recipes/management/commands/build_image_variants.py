@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from recipes.images import get_executor, process_variants, variant_names
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Проверить все изображения, а не только без копий',
+        )
+
+    def handle(self, *args, **options):
+        names = set()
+        for name, variants in Recipe.objects.exclude(image='').values_list(
+            'image', 'image_variants'
+        ).iterator():
+            if options['all'] or variants != variant_names(name):
+                names.add(name)
+        failed = sum(
+            variants is None
+            for variants in get_executor().map(process_variants, names)
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(names) - failed}'
+        ))
+        if failed:
+            self.stderr.write(self.style.ERROR(f'С ошибками: {failed}'))
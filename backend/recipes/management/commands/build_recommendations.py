@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.recommendations import build_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет похожих рецептов и персональных рекомендаций '
+        'по избранному, корзинам, ингредиентам и тегам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbors', type=int,
+            default=settings.RECOMMENDATION_NEIGHBORS,
+            help='Похожих рецептов на рецепт, по умолчанию '
+                 'RECOMMENDATION_NEIGHBORS',
+        )
+        parser.add_argument(
+            '--feed-size', type=int,
+            default=settings.RECOMMENDATION_FEED_SIZE,
+            help='Рекомендаций на пользователя, по умолчанию '
+                 'RECOMMENDATION_FEED_SIZE',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        similar, feeds = build_recommendations(
+            options['neighbors'], options['feed_size'],
+            options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано похожих рецептов: {similar}, рекомендаций: {feeds} '
+            f'за {time.perf_counter() - start:.1f} с'
+        ))
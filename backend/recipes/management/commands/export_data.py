@@ -0,0 +1,56 @@
+from django.core.management import BaseCommand
+
+from recipes.transfer import (FORMATS, TRANSFERS, RowWriter, detect_format,
+                              open_file)
+
+
+class Command(BaseCommand):
+    help = (
+        'Экспорт ингредиентов, тегов, пользователей или рецептов '
+        'в csv, json или ndjson'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=TRANSFERS)
+        parser.add_argument(
+            'path', help='Путь к файлу, "-" — стандартный вывод',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--images',
+            help='Каталог, куда скопировать изображения рецептов',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        transfer = TRANSFERS[options['entity']](images=options['images'])
+        exported = 0
+        with open_file(path, 'w') as file:
+            writer = RowWriter(
+                file, options['format'] or detect_format(path),
+                transfer.fields,
+            )
+            for row in transfer.export_rows(options['batch_size']):
+                writer.write(row)
+                exported += 1
+                if (
+                    options['verbosity'] > 0
+                    and exported % options['batch_size'] == 0
+                ):
+                    self.stderr.write(
+                        f'{options["entity"]}: {exported}', ending='\r'
+                    )
+            writer.close()
+        if options['verbosity'] > 0 and exported >= options['batch_size']:
+            self.stderr.write('')
+        if transfer.missing_images:
+            self.stderr.write(self.style.WARNING(
+                f'Не найдено изображений: {transfer.missing_images}'
+            ))
+        self.stderr.write(self.style.SUCCESS(
+            f'{options["entity"]}: выгружено {exported}'
+        ))
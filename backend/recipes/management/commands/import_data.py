@@ -0,0 +1,85 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from api.cache import catalog_cache, response_cache
+from recipes.images import schedule_variants
+from recipes.search import ingredient_search
+from recipes.transfer import (FORMATS, TRANSFERS, detect_format, import_rows,
+                              open_file, read_rows)
+
+
+class Command(BaseCommand):
+    help = (
+        'Импорт ингредиентов, тегов, пользователей или рецептов '
+        'из csv, json или ndjson. Рецепты загружаются после '
+        'пользователей, тегов и ингредиентов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=TRANSFERS)
+        parser.add_argument(
+            'path', help='Путь к файлу, "-" — стандартный ввод',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов загрузки (только PostgreSQL)',
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Обновлять уже существующие записи',
+        )
+        parser.add_argument(
+            '--images', help='Каталог с файлами изображений рецептов',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            raise CommandError(
+                'SQLite не поддерживает параллельную запись, '
+                'используйте --workers 1'
+            )
+        transfer = TRANSFERS[options['entity']](
+            update=options['update'], images=options['images'],
+        )
+        format = options['format'] or detect_format(path)
+        processed = created = updated = missing_images = 0
+        cache_tags = set()
+        with open_file(path) as file:
+            try:
+                for result in import_rows(
+                    transfer, read_rows(file, format),
+                    options['batch_size'], options['workers'],
+                ):
+                    processed += result.processed
+                    created += result.created
+                    updated += result.updated
+                    missing_images += result.missing_images
+                    cache_tags |= result.cache_tags
+                    for name in result.variant_images:
+                        schedule_variants(name)
+                    if options['verbosity'] > 0:
+                        self.stderr.write(
+                            f'{options["entity"]}: {processed}', ending='\r'
+                        )
+            except (KeyError, ValueError) as error:
+                raise CommandError(f'Ошибка в записи: {error}')
+            finally:
+                catalog_cache.bump()
+                response_cache.invalidate('catalog', *cache_tags)
+                ingredient_search.invalidate()
+        if options['verbosity'] > 0 and processed:
+            self.stderr.write('')
+        if missing_images:
+            self.stderr.write(self.style.WARNING(
+                f'Не найдено изображений: {missing_images}'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["entity"]}: обработано {processed}, '
+            f'создано {created}, обновлено {updated}'
+        ))
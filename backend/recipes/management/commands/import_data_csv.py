@@ -1,20 +1,12 @@
-import csv
-
-from django.core.management import BaseCommand
-
-from recipes.models import Ingredient
+from django.core.management import BaseCommand, call_command
 
 
 class Command(BaseCommand):
     help = 'Загрузка из csv файла'
 
     def handle(self, *args, **kwargs):
-        with open(
-            './data/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            reader = csv.DictReader(file)
-            Ingredient.objects.bulk_create(
-                Ingredient(**data) for data in reader)
+        call_command(
+            'import_data', 'ingredients', './data/ingredients.csv',
+            verbosity=0,
+        )
         self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
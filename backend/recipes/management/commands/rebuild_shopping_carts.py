@@ -0,0 +1,53 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Проверка и пересборка сумм ингредиентов в корзинах покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, ничего не меняя',
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя (можно указать несколько раз)',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        stored = ShoppingCartIngredient.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in stored.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        }
+        expected = ShoppingCartIngredient.objects.expected(user_ids)
+        drifted = {
+            key for key in stored.keys() | expected.keys()
+            if stored.get(key) != expected.get(key)
+        }
+        for user_id, ingredient_id in sorted(drifted):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'{stored.get((user_id, ingredient_id))} вместо '
+                f'{expected.get((user_id, ingredient_id))}'
+            )
+        if options['check']:
+            if drifted:
+                raise CommandError(f'Расхождений: {len(drifted)}')
+            self.stdout.write(self.style.SUCCESS('Корзины согласованы'))
+            return
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.rebuild(
+                user_ids or {user_id for user_id, _ in drifted}
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Корзины пересобраны, исправлено расхождений: {len(drifted)}'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import COUNTERS, find_drift, recount
+
+
+class Command(BaseCommand):
+    help = 'Проверка и исправление счетчиков избранного, корзин и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        with transaction.atomic():
+            for counter in COUNTERS:
+                drifted = find_drift(counter)
+                for pk, stored, expected in drifted:
+                    self.stdout.write(
+                        f'{counter.model.__name__}.{counter.field} '
+                        f'pk={pk}: {stored} вместо {expected}'
+                    )
+                if drifted and not options['check']:
+                    recount(counter, [pk for pk, _, _ in drifted])
+                total += len(drifted)
+        if options['check']:
+            if total:
+                raise CommandError(f'Расхождений: {total}')
+            self.stdout.write(self.style.SUCCESS('Счетчики согласованы'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики проверены, исправлено расхождений: {total}'
+        ))
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.cache import response_cache
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет популярности рецептов за последние дни '
+        '(для сортировки ordering=trending)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.TRENDING_DAYS,
+            help='Период в днях, по умолчанию TRENDING_DAYS',
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        with transaction.atomic():
+            changed = Recipe.objects.refresh_trending(since)
+        if changed:
+            response_cache.invalidate('recipes')
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность обновлена, изменено рецептов: {changed}'
+        ))
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Recipe
+from recipes.search import recipe_search
+
+
+class Command(BaseCommand):
+    help = 'Пересчет поисковых векторов рецептов (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Поисковые векторы хранятся только в PostgreSQL, '
+                'на остальных СУБД используется индекс в памяти'
+            )
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(Recipe.objects.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                recipe_search.refresh(ids)
+            total += len(ids)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено поисковых векторов: {total}'
+        ))
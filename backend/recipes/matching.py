@@ -0,0 +1,344 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from .models import IngredientRecipe, Recipe
+
+
+class RecipeMatchIndex:
+    """
+    Индекс «что приготовить» в памяти процесса.
+
+    postings: ingredient_id → отсортированный array('I') id рецептов.
+    Состав рецептов хранится сжатыми массивами offsets/flat в порядке от
+    редких ингредиентов к частым, а levels[k] — это ingredient_id → id
+    рецептов, у которых этот ингредиент k-й по редкости. Если рецепту не
+    хватает не больше k ингредиентов, один из первых k + 1 есть в запросе,
+    поэтому такие рецепты находятся по коротким спискам levels[0..k], а не
+    по длинным postings частых ингредиентов.
+
+    Время готовки и маска тегов лежат в массивах, индексированных id
+    рецепта. Списки в postings и levels не меняются на месте, а заменяются
+    копиями, поэтому поиск может идти параллельно с обновлением.
+    """
+
+    depth = 4
+
+    def __init__(self):
+        self.postings = {}
+        self.levels = [{} for _ in range(self.depth)]
+        self.offsets = array('I', [0])
+        self.flat = array('I')
+        self.changed = {}
+        self.times = array('H')
+        self.tag_masks = []
+        self.tag_bits = {}
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls):
+        max_id = Recipe.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        return cls.from_rows(
+            max_id,
+            Recipe.objects.values_list('id', 'cooking_time').iterator(),
+            Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag_id'
+            ).iterator(),
+            IngredientRecipe.objects.order_by(
+                'ingredient_id', 'recipe_id'
+            ).values_list('ingredient_id', 'recipe_id').iterator(),
+        )
+
+    @classmethod
+    def from_rows(cls, max_id, recipes, tags, ingredients):
+        """
+        Строит индекс из строк (id, cooking_time), (recipe_id, tag_id) и
+        (ingredient_id, recipe_id), отсортированных по ingredient_id и
+        recipe_id.
+        """
+        index = cls()
+        index.grow(max_id)
+        for recipe_id, cooking_time in recipes:
+            index.grow(recipe_id)
+            index.times[recipe_id] = cooking_time
+        for recipe_id, tag_id in tags:
+            index.grow(recipe_id)
+            index.tag_masks[recipe_id] |= index.tag_bit(tag_id)
+        postings = index.postings
+        for ingredient_id, recipe_id in ingredients:
+            posting = postings.get(ingredient_id)
+            if posting is None:
+                posting = postings[ingredient_id] = array('I')
+            posting.append(recipe_id)
+            index.grow(recipe_id)
+
+        sizes = array('I', bytes(4 * len(index.times)))
+        for posting in postings.values():
+            for recipe_id in posting:
+                sizes[recipe_id] += 1
+        offsets = array('I', [0])
+        total = 0
+        for size in sizes:
+            total += size
+            offsets.append(total)
+        flat = array('I', bytes(4 * total))
+        cursor = offsets[:-1]
+        for ingredient_id in sorted(postings, key=lambda i: len(postings[i])):
+            for recipe_id in postings[ingredient_id]:
+                flat[cursor[recipe_id]] = ingredient_id
+                cursor[recipe_id] += 1
+        for recipe_id, size in enumerate(sizes):
+            start = offsets[recipe_id]
+            for level in range(min(size, cls.depth)):
+                index.levels[level].setdefault(
+                    flat[start + level], array('I')
+                ).append(recipe_id)
+        index.offsets = offsets
+        index.flat = flat
+        return index
+
+    def grow(self, recipe_id):
+        missing = recipe_id + 1 - len(self.times)
+        if missing > 0:
+            self.times.extend([0] * missing)
+            self.tag_masks.extend([0] * missing)
+            self.offsets.extend([self.offsets[-1]] * missing)
+
+    def tag_bit(self, tag_id):
+        if tag_id not in self.tag_bits:
+            self.tag_bits[tag_id] = 1 << len(self.tag_bits)
+        return self.tag_bits[tag_id]
+
+    def ingredients(self, recipe_id):
+        """Ингредиенты рецепта от редких к частым."""
+        ingredients = self.changed.get(recipe_id)
+        if ingredients is not None:
+            return ingredients
+        if recipe_id + 1 < len(self.offsets):
+            return self.flat[
+                self.offsets[recipe_id]:self.offsets[recipe_id + 1]
+            ]
+        return ()
+
+    @staticmethod
+    def discard(lists, key, recipe_id):
+        posting = lists.get(key, ())
+        position = bisect_left(posting, recipe_id)
+        if position < len(posting) and posting[position] == recipe_id:
+            posting = array('I', posting)
+            del posting[position]
+            lists[key] = posting
+
+    @staticmethod
+    def insert(lists, key, recipe_id):
+        posting = array('I', lists.get(key, ()))
+        insort(posting, recipe_id)
+        lists[key] = posting
+
+    def remove(self, recipe_ids):
+        """Убирает рецепты из индекса."""
+        for recipe_id in recipe_ids:
+            ingredients = self.ingredients(recipe_id)
+            for ingredient_id in ingredients:
+                self.discard(self.postings, ingredient_id, recipe_id)
+            for level, ingredient_id in enumerate(ingredients[:self.depth]):
+                self.discard(self.levels[level], ingredient_id, recipe_id)
+            self.changed[recipe_id] = ()
+            if recipe_id < len(self.times):
+                self.times[recipe_id] = 0
+                self.tag_masks[recipe_id] = 0
+
+    def reload(self, recipe_ids):
+        """Перечитывает рецепты recipe_ids из базы."""
+        recipe_ids = set(recipe_ids)
+        self.remove(recipe_ids)
+        for recipe_id, cooking_time in Recipe.objects.filter(
+            id__in=recipe_ids
+        ).values_list('id', 'cooking_time'):
+            self.grow(recipe_id)
+            self.times[recipe_id] = cooking_time
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id'):
+            self.tag_masks[recipe_id] |= self.tag_bit(tag_id)
+        compositions = {}
+        for ingredient_id, recipe_id in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'recipe_id'):
+            compositions.setdefault(recipe_id, []).append(ingredient_id)
+        for recipe_id, ingredients in compositions.items():
+            ingredients.sort(key=lambda i: len(self.postings.get(i, ())))
+            for ingredient_id in ingredients:
+                self.insert(self.postings, ingredient_id, recipe_id)
+            for level, ingredient_id in enumerate(ingredients[:self.depth]):
+                self.insert(self.levels[level], ingredient_id, recipe_id)
+            self.changed[recipe_id] = tuple(ingredients)
+
+    def match(self, ingredient_ids, limit, max_time=None, tag_ids=None,
+              max_missing=None):
+        """
+        Рецепты, где есть хотя бы один из ингредиентов, в порядке
+        (меньше недостающих, больше совпавших, новее):
+        [(recipe_id, совпало, не хватает)].
+        """
+        pantry = set(ingredient_ids)
+        mask = 0
+        if tag_ids is not None:
+            for tag_id in tag_ids:
+                mask |= self.tag_bits.get(tag_id, 0)
+            if not mask:
+                return []
+        times, tag_masks = self.times, self.tag_masks
+        flat, offsets, changed = self.flat, self.offsets, self.changed
+        intersection = pantry.intersection
+
+        def rank(recipe_ids):
+            for recipe_id in recipe_ids:
+                if max_time is not None and times[recipe_id] > max_time:
+                    continue
+                if mask and not tag_masks[recipe_id] & mask:
+                    continue
+                ingredients = changed.get(recipe_id)
+                if ingredients is None:
+                    ingredients = flat[
+                        offsets[recipe_id]:offsets[recipe_id + 1]
+                    ]
+                matched = len(intersection(ingredients))
+                missing = len(ingredients) - matched
+                if max_missing is None or missing <= max_missing:
+                    ranked.append((missing, -matched, -recipe_id))
+
+        seen = set()
+        ranked = []
+        depth = self.depth
+        if max_missing is not None:
+            depth = min(depth, max_missing + 1)
+        for level in range(depth):
+            lists = self.levels[level]
+            found = set().union(*(
+                lists[ingredient_id] for ingredient_id in pantry
+                if ingredient_id in lists
+            ))
+            found -= seen
+            seen |= found
+            rank(found)
+            # Все рецепты, которым не хватает не больше level, уже найдены.
+            complete = [entry for entry in ranked if entry[0] <= level]
+            if len(complete) >= limit or level == max_missing:
+                return self.top(complete, limit)
+
+        counts = Counter()
+        for ingredient_id in pantry:
+            counts.update(self.postings.get(ingredient_id, ()))
+        rank(counts.keys() - seen)
+        return self.top(ranked, limit)
+
+    @staticmethod
+    def top(entries, limit):
+        return [
+            (-recipe_id, -matched, missing)
+            for missing, matched, recipe_id in heapq.nsmallest(limit, entries)
+        ]
+
+
+class RecipeMatcher:
+    """
+    Индекс RecipeMatchIndex с синхронизацией между процессами.
+
+    После коммита изменения рецептов увеличивают общую версию в кеше
+    Django и записывают под ней id рецептов. Процесс при запросе
+    перечитывает только эти рецепты; если изменений слишком много или
+    часть записей вытеснена из кеша, индекс строится заново. Вытесненная
+    версия заводится заново от текущего времени в наносекундах, поэтому
+    не повторяет номер, который процесс уже видел.
+    """
+
+    version_key = 'recipe-match:version'
+    changes_key = 'recipe-match:changes:{}'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.index = None
+        self.version = None
+
+    def changed(self, recipe_ids):
+        """Отмечает рецепты измененными; публикуется после коммита."""
+        pending = getattr(self.local, 'pending', None)
+        if pending is None:
+            pending = self.local.pending = set()
+        pending.update(recipe_ids)
+        transaction.on_commit(self.publish)
+
+    def publish(self):
+        pending = getattr(self.local, 'pending', None)
+        if not pending:
+            return
+        recipe_ids = list(pending)
+        pending.clear()
+        self.get_version()
+        try:
+            version = cache.incr(self.version_key)
+        except ValueError:
+            return
+        cache.set(
+            self.changes_key.format(version), recipe_ids,
+            settings.RECIPE_MATCH_TTL,
+        )
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def get_index(self):
+        version = self.get_version()
+        with self.lock:
+            if self.needs_rebuild(version):
+                self.index = RecipeMatchIndex.build()
+            elif version != self.version:
+                keys = [
+                    self.changes_key.format(number)
+                    for number in range(self.version + 1, version + 1)
+                ]
+                changes = cache.get_many(keys)
+                if len(changes) == len(keys):
+                    self.index.reload(
+                        set().union(*map(set, changes.values()))
+                    )
+                else:
+                    self.index = RecipeMatchIndex.build()
+            self.version = version
+            return self.index
+
+    def needs_rebuild(self, version):
+        if self.index is None:
+            return True
+        if (
+            time.monotonic() - self.index.built_at
+            > settings.RECIPE_MATCH_TTL
+        ):
+            return True
+        if version == self.version:
+            return False
+        return (
+            version is None or self.version is None
+            or version < self.version
+            or version - self.version > settings.RECIPE_MATCH_MAX_CHANGES
+        )
+
+    def match(self, ingredient_ids, limit, **filters):
+        return self.get_index().match(ingredient_ids, limit, **filters)
+
+
+recipe_matcher = RecipeMatcher()
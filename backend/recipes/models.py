@@ -1,8 +1,13 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Case, Count, F, Prefetch, Sum,
+                              UniqueConstraint, Value, When, Window)
+from django.db.models.functions import Greatest, RowNumber
+
+from .images import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -10,6 +15,14 @@ LENGTH_TEXT = 20
 LENGTH_NAME = 200
 LENGTH_SLUG = 50
 
+# Варианты сортировки списка рецептов; под каждый есть индекс в Recipe.
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-id'),
+    'quickest': ('cooking_time', 'id'),
+    'trending': ('-trending_score', '-id'),
+}
+
 
 class Ingredient(models.Model):
     name = models.CharField(
@@ -24,6 +37,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient',
+            )
+        ]
 
     def __str__(self):
         return self.name[:LENGTH_TEXT]
@@ -59,6 +78,72 @@ class Tag(models.Model):
         return self.name[:LENGTH_TEXT]
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние рецепты авторов одним запросом: {author_id: [recipe]}.
+
+        При limit берутся первые limit рецептов каждого автора по
+        ROW_NUMBER() OVER (PARTITION BY author_id).
+        """
+        if not author_ids:
+            return {}
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is None:
+            recipes = queryset.order_by('author_id', '-pub_date', '-id')
+        else:
+            sql, params = queryset.annotate(position=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )).order_by().query.sql_with_params()
+            recipes = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) ranked WHERE position <= %s '
+                f'ORDER BY author_id, position',
+                (*params, limit),
+            )
+        by_author = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        return by_author
+
+    def refresh_trending(self, since):
+        """
+        Пересчитывает trending_score — число добавлений в избранное
+        начиная с since. Обновляются только изменившиеся строки.
+        """
+        scores = dict(
+            Favorite.objects.filter(created__gte=since)
+            .order_by().values('recipe')
+            .annotate(total=Count('id')).values_list('recipe', 'total')
+        )
+        current = dict(
+            self.filter(trending_score__gt=0)
+            .values_list('id', 'trending_score')
+        )
+        changed = {}
+        for recipe_id in scores.keys() | current.keys():
+            score = scores.get(recipe_id, 0)
+            if score != current.get(recipe_id, 0):
+                changed.setdefault(score, []).append(recipe_id)
+        for score, recipe_ids in changed.items():
+            self.filter(id__in=recipe_ids).update(trending_score=score)
+        return sum(map(len, changed.values()))
+
+    def with_related(self):
+        """Рецепты с подгруженными автором, тегами и ингредиентами."""
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+            ),
+        )
+
+
 class Recipe(models.Model):
     name = models.CharField(
         max_length=LENGTH_NAME,
@@ -72,8 +157,30 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
         verbose_name="Изображение",
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах',
+    )
+    trending_score = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность за период',
+    )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Минут до готовности',
         validators=[
@@ -86,6 +193,15 @@ class Recipe(models.Model):
     text = models.TextField(
         verbose_name='Описание',
     )
+    pub_date = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата публикации',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         verbose_name='Ингредиенты',
@@ -98,9 +214,21 @@ class Recipe(models.Model):
         related_name='recipes',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = RECIPE_ORDERINGS['newest']
+        indexes = [
+            models.Index(fields=fields, name=f'recipe_{name}_idx')
+            for name, fields in RECIPE_ORDERINGS.items()
+        ] + [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_newest_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name[:LENGTH_TEXT]
@@ -119,12 +247,14 @@ class IngredientRecipe(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Ингредиент',
         related_name="recipe",
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
         related_name="ingredient",
+        db_index=False,
     )
 
     def __str__(self):
@@ -133,6 +263,20 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
+        # Составные индексы заменяют индексы внешних ключей: по рецепту
+        # ищется состав, по ингредиенту — корзины и индекс подбора.
+        constraints = [
+            UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_ingredient_recipe',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='ingredient_recipe_idx',
+            ),
+        ]
 
 
 class Favorite(models.Model):
@@ -148,6 +292,10 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлен',
+    )
 
     def __str__(self):
         return f'Избранный {self.recipe} у {self.user}'
@@ -159,6 +307,11 @@ class Favorite(models.Model):
                 name='unique_favorite_user_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['created', 'recipe'], name='favorite_created_idx'
+            ),
+        ]
         verbose_name = 'Объект избранного'
         verbose_name_plural = 'Объекты избранного'
 
@@ -189,3 +342,194 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Корзину покупок'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+
+    def apply(self, user_ids, amounts):
+        """Прибавляет amounts {ingredient_id: delta} к корзинам user_ids."""
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: delta
+            for ingredient_id, delta in amounts.items() if delta
+        }
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=0)
+                for user_id in user_ids
+                for ingredient_id, delta in amounts.items() if delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        rows.update(amount=Greatest(F('amount') + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(delta))
+                for ingredient_id, delta in amounts.items()
+            ],
+            output_field=models.IntegerField(),
+        ), 0))
+        rows.filter(amount=0).delete()
+
+    def add_recipe(self, user, recipe_id, sign=1):
+        self.apply([user.pk], {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in IngredientRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')
+        })
+
+    def remove_recipe(self, user, recipe_id):
+        self.add_recipe(user, recipe_id, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в корзины с этим рецептом."""
+        self.apply(
+            recipe.shopping_cart.values_list('user_id', flat=True),
+            {
+                ingredient_id: (
+                    new_amounts.get(ingredient_id, 0)
+                    - old_amounts.get(ingredient_id, 0)
+                )
+                for ingredient_id in old_amounts.keys() | new_amounts.keys()
+            },
+        )
+
+    def expected(self, user_ids=None):
+        """Суммы, посчитанные заново по ShoppingCart и IngredientRecipe."""
+        if user_ids is None:
+            rows = IngredientRecipe.objects.filter(
+                recipe__shopping_cart__isnull=False
+            )
+        else:
+            rows = IngredientRecipe.objects.filter(
+                recipe__shopping_cart__user__in=user_ids
+            )
+        return {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in rows.values(
+                'ingredient_id', user_id=F('recipe__shopping_cart__user'),
+            ).annotate(total=Sum('amount')).filter(total__gt=0)
+        }
+
+    def rebuild(self, user_ids=None):
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows.delete()
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+                for (user_id, ingredient_id), amount
+                in self.expected(user_ids).items()
+            ],
+            batch_size=1000,
+        )
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='cart_amounts',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзинах'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} у {self.user}: {self.amount}'
+
+
+class SimilarRecipe(models.Model):
+    """Сосед рецепта по сходству; строится командой build_recommendations."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbors',
+        verbose_name='Рецепт',
+    )
+    neighbor = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbor_of',
+        verbose_name='Похожий рецепт',
+    )
+    position = models.PositiveSmallIntegerField(
+        verbose_name='Место',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            UniqueConstraint(
+                fields=['recipe', 'position'],
+                name='unique_similar_recipe_position',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.neighbor} похож на {self.recipe}'
+
+
+class Recommendation(models.Model):
+    """Рекомендованный рецепт; строится командой build_recommendations."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recommended_for',
+        verbose_name='Рецепт',
+    )
+    position = models.PositiveSmallIntegerField(
+        verbose_name='Место',
+    )
+    score = models.FloatField(
+        verbose_name='Оценка',
+    )
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'position'],
+                name='unique_recommendation_position',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} для {self.user}'
@@ -0,0 +1,190 @@
+import heapq
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import (Favorite, IngredientRecipe, Recipe, Recommendation,
+                     ShoppingCart, SimilarRecipe)
+from .transfer import batched
+
+
+def load_signals():
+    """Пары (recipe_id, признак) по источникам RECOMMENDATION_WEIGHTS."""
+    return {
+        'favorites': Favorite.objects.values_list('recipe_id', 'user_id'),
+        'carts': ShoppingCart.objects.values_list('recipe_id', 'user_id'),
+        'ingredients': IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ),
+        'tags': Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ),
+    }
+
+
+class SimilarityModel:
+    """
+    Косинусное сходство рецептов по разреженным векторам признаков.
+
+    Признак — пользователь, добавивший рецепт в избранное или корзину,
+    ингредиент или тег. Вес признака — вес источника, умноженный на
+    log(1 + N / df); признаки, которые есть больше чем у
+    RECOMMENDATION_MAX_DF доли рецептов, отбрасываются: они почти не
+    различают рецепты. Кандидаты в соседи берутся из списков самых редких
+    признаков рецепта, не больше RECOMMENDATION_CANDIDATES, и только для
+    них считается точное сходство: время на рецепт не растет с каталогом.
+    """
+
+    def __init__(self, signals, recipes_total):
+        weights = settings.RECOMMENDATION_WEIGHTS
+        postings = defaultdict(list)
+        for source, pairs in signals.items():
+            for recipe_id, value in pairs.iterator():
+                postings[source, value].append(recipe_id)
+        max_df = max(
+            int(recipes_total * settings.RECOMMENDATION_MAX_DF), 100
+        )
+        self.vectors = defaultdict(dict)
+        self.postings = {}
+        for feature, recipe_ids in postings.items():
+            if len(recipe_ids) > max_df:
+                continue
+            weight = weights[feature[0]] * math.log(
+                1 + recipes_total / len(recipe_ids)
+            )
+            self.postings[feature] = recipe_ids
+            for recipe_id in recipe_ids:
+                self.vectors[recipe_id][feature] = weight
+        self.norms = {
+            recipe_id: math.sqrt(sum(w * w for w in vector.values()))
+            for recipe_id, vector in self.vectors.items()
+        }
+
+    def neighbors(self, recipe_id, limit):
+        """Самые похожие рецепты: [(neighbor_id, сходство)]."""
+        vector = self.vectors.get(recipe_id)
+        if not vector:
+            return []
+        limit_candidates = settings.RECOMMENDATION_CANDIDATES + 1
+        candidates = set()
+        for feature in sorted(
+            vector, key=lambda feature: len(self.postings[feature])
+        ):
+            candidates.update(islice(
+                self.postings[feature], limit_candidates - len(candidates)
+            ))
+            if len(candidates) >= limit_candidates:
+                break
+        candidates.discard(recipe_id)
+        dots = {}
+        for other_id in candidates:
+            other = self.vectors[other_id]
+            dots[other_id] = sum(
+                weight * other[feature]
+                for feature, weight in vector.items() if feature in other
+            )
+        norm = self.norms[recipe_id]
+        return [
+            (other_id, dot / (norm * self.norms[other_id]))
+            for other_id, dot in heapq.nlargest(
+                limit, dots.items(), key=lambda item: (item[1], item[0])
+            )
+        ]
+
+
+def user_items():
+    """user_id → {recipe_id: вес} по избранному и корзине."""
+    weights = settings.RECOMMENDATION_WEIGHTS
+    items = defaultdict(dict)
+    for source, model in (
+        ('favorites', Favorite), ('carts', ShoppingCart),
+    ):
+        for user_id, recipe_id in model.objects.values_list(
+            'user_id', 'recipe_id'
+        ).iterator():
+            user = items[user_id]
+            user[recipe_id] = user.get(recipe_id, 0) + weights[source]
+    return items
+
+
+def recommend(items, neighbors, exclude, limit):
+    """
+    Рецепты, похожие на items, без уже отмеченных и exclude:
+    [(recipe_id, оценка)].
+    """
+    scores = defaultdict(float)
+    for recipe_id, weight in items.items():
+        for neighbor_id, score in neighbors.get(recipe_id, ()):
+            scores[neighbor_id] += weight * score
+    for recipe_id in items:
+        scores.pop(recipe_id, None)
+    for recipe_id in exclude:
+        scores.pop(recipe_id, None)
+    return heapq.nlargest(
+        limit, scores.items(), key=lambda item: (item[1], item[0])
+    )
+
+
+def replace_rows(model, owner, target, rows_by_owner, batch_size):
+    """
+    Заменяет строки model пачками по диапазонам owner_id; строки
+    владельцев, которых нет в rows_by_owner, удаляются.
+    """
+    lower = 0
+    written = 0
+    for owner_ids in batched(sorted(rows_by_owner), batch_size):
+        with transaction.atomic():
+            model.objects.filter(**{
+                f'{owner}_id__gt': lower, f'{owner}_id__lte': owner_ids[-1],
+            }).delete()
+            rows = [
+                model(**{
+                    f'{owner}_id': owner_id, f'{target}_id': target_id,
+                    'position': position, 'score': score,
+                })
+                for owner_id in owner_ids
+                for position, (target_id, score) in enumerate(
+                    rows_by_owner[owner_id]
+                )
+            ]
+            model.objects.bulk_create(rows, batch_size=batch_size)
+        written += len(rows)
+        lower = owner_ids[-1]
+    model.objects.filter(**{f'{owner}_id__gt': lower}).delete()
+    return written
+
+
+def build_recommendations(neighbors_limit=None, feed_limit=None,
+                          batch_size=1000):
+    """
+    Пересчитывает похожие рецепты и персональные рекомендации;
+    возвращает число записанных строк тех и других.
+    """
+    neighbors_limit = neighbors_limit or settings.RECOMMENDATION_NEIGHBORS
+    feed_limit = feed_limit or settings.RECOMMENDATION_FEED_SIZE
+    authors = dict(Recipe.objects.values_list('id', 'author_id').iterator())
+    model = SimilarityModel(load_signals(), len(authors))
+    neighbors = {}
+    for recipe_id in model.vectors:
+        found = model.neighbors(recipe_id, neighbors_limit)
+        if found:
+            neighbors[recipe_id] = found
+    similar_rows = replace_rows(
+        SimilarRecipe, 'recipe', 'neighbor', neighbors, batch_size
+    )
+
+    own = defaultdict(set)
+    for recipe_id, author_id in authors.items():
+        own[author_id].add(recipe_id)
+    feeds = {}
+    for user_id, items in user_items().items():
+        found = recommend(items, neighbors, own[user_id], feed_limit)
+        if found:
+            feeds[user_id] = found
+    feed_rows = replace_rows(
+        Recommendation, 'user', 'recipe', feeds, batch_size
+    )
+    return similar_rows, feed_rows
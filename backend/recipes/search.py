@@ -0,0 +1,307 @@
+import difflib
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import (Case, F, FloatField, IntegerField, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Upper
+
+from .models import Ingredient, IngredientRecipe, Recipe
+
+PREFIX_MATCH = 0
+SUBSTRING_MATCH = 1
+FUZZY_MATCH = 2
+
+
+class IngredientIndex:
+    """
+    Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Индекс общий для потоков процесса, поэтому LRU результатов поиска
+    читается и изменяется под блокировкой; сам поиск идет без нее.
+    """
+
+    def __init__(self, rows, cache_size):
+        self.entries = sorted(
+            (name.casefold(), ingredient_id) for ingredient_id, name in rows
+        )
+        self.keys = [key for key, _ in self.entries]
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit):
+        query = query.casefold()
+        cache_key = (query, limit)
+        with self.lock:
+            found = self.cache.get(cache_key)
+            if found is not None:
+                self.cache.move_to_end(cache_key)
+                return found
+
+        found = []
+        seen = set()
+        position = bisect_left(self.keys, query)
+        while (
+            position < len(self.entries)
+            and len(found) < limit
+            and self.keys[position].startswith(query)
+        ):
+            found.append(self.entries[position][1])
+            seen.add(self.entries[position][1])
+            position += 1
+
+        if len(found) < limit:
+            substring = sorted(
+                (key.find(query), key, ingredient_id)
+                for key, ingredient_id in self.entries
+                if ingredient_id not in seen and query in key
+            )
+            for _, _, ingredient_id in substring[:limit - len(found)]:
+                found.append(ingredient_id)
+                seen.add(ingredient_id)
+
+        if len(found) < limit and len(query) > 2:
+            ids = dict(self.entries)
+            for key in difflib.get_close_matches(
+                query, self.keys, n=limit, cutoff=0.6
+            ):
+                if len(found) >= limit:
+                    break
+                if ids[key] not in seen:
+                    found.append(ids[key])
+                    seen.add(ids[key])
+
+        with self.lock:
+            self.cache[cache_key] = found
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return found
+
+
+class RecipeIndex:
+    """
+    Инвертированный индекс рецептов в памяти процесса.
+
+    Слово запроса совпадает со словами индекса, которые с него
+    начинаются. Вес совпадения зависит от поля, как у весов A, B, C
+    поискового вектора PostgreSQL.
+    """
+
+    weights = {'name': 4, 'ingredients': 2, 'text': 1}
+
+    def __init__(self, recipes, ingredients):
+        self.postings = defaultdict(dict)
+        for recipe_id, name, text in recipes:
+            self.add(recipe_id, name, self.weights['name'])
+            self.add(recipe_id, text, self.weights['text'])
+        for recipe_id, name in ingredients:
+            self.add(recipe_id, name, self.weights['ingredients'])
+        self.words = sorted(self.postings)
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r'\w+', text.casefold().replace('ё', 'е'))
+
+    def add(self, recipe_id, text, weight):
+        for word in self.tokenize(text):
+            postings = self.postings[word]
+            postings[recipe_id] = postings.get(recipe_id, 0) + weight
+
+    def match(self, prefix):
+        found = {}
+        position = bisect_left(self.words, prefix)
+        while (
+            position < len(self.words)
+            and self.words[position].startswith(prefix)
+        ):
+            for recipe_id, weight in self.postings[
+                self.words[position]
+            ].items():
+                found[recipe_id] = max(found.get(recipe_id, 0), weight)
+            position += 1
+        return found
+
+    def search(self, query):
+        """Рецепты со всеми словами запроса: {recipe_id: вес}."""
+        scores = None
+        for word in self.tokenize(query):
+            found = self.match(word)
+            if scores is None:
+                scores = found
+            else:
+                scores = {
+                    recipe_id: scores[recipe_id] + weight
+                    for recipe_id, weight in found.items()
+                    if recipe_id in scores
+                }
+            if not scores:
+                break
+        return scores or {}
+
+
+class MemoryIndexSearch:
+    """
+    Поиск с запасным индексом в памяти процесса для СУБД без
+    полнотекстовых индексов. Индекс перестраивается после invalidate()
+    или по истечении ttl_setting секунд.
+    """
+
+    ttl_setting = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+    def invalidate(self, **kwargs):
+        self.index = None
+
+    def build_index(self):
+        raise NotImplementedError
+
+    def get_index(self):
+        index = self.index
+        if index is None or self.is_stale(index):
+            with self.lock:
+                index = self.index
+                if index is None or self.is_stale(index):
+                    index = self.build_index()
+                    self.index = index
+        return index
+
+    def is_stale(self, index):
+        return (
+            time.monotonic() - index.built_at
+            > getattr(settings, self.ttl_setting)
+        )
+
+
+class IngredientSearch(MemoryIndexSearch):
+    """
+    Ранжированный поиск ингредиентов без учета регистра.
+
+    Сначала идут совпадения по префиксу, затем по подстроке, затем похожие
+    названия. На PostgreSQL поиск выполняется в базе по GIN-индексу
+    pg_trgm, на остальных СУБД — по индексу в памяти процесса.
+    """
+
+    ttl_setting = 'INGREDIENT_SEARCH_TTL'
+
+    def build_index(self):
+        return IngredientIndex(
+            Ingredient.objects.values_list('id', 'name'),
+            settings.INGREDIENT_SEARCH_CACHE_SIZE,
+        )
+
+    def search(self, queryset, query, limit=None):
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = query.strip()
+        if not query:
+            return queryset
+        if connection.vendor == 'postgresql':
+            return self.search_database(queryset, query, limit)
+        ids = self.get_index().search(query, limit)
+        return queryset.filter(pk__in=ids).order_by(Case(
+            *[When(pk=pk, then=Value(rank)) for rank, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        ))
+
+    def search_database(self, queryset, query, limit):
+        query = query.upper()
+        return queryset.annotate(
+            name_upper=Upper('name'),
+        ).annotate(
+            match=Case(
+                When(name_upper__startswith=query, then=Value(PREFIX_MATCH)),
+                When(name_upper__contains=query, then=Value(SUBSTRING_MATCH)),
+                default=Value(FUZZY_MATCH),
+                output_field=IntegerField(),
+            ),
+            similarity=TrigramSimilarity('name_upper', query),
+        ).filter(
+            Q(name_upper__contains=query)
+            | Q(name_upper__trigram_similar=query)
+        ).order_by('match', '-similarity', 'name', 'id')[:limit]
+
+
+class RecipeSearch(MemoryIndexSearch):
+    """
+    Полнотекстовый поиск рецептов по названию, ингредиентам и описанию.
+
+    На PostgreSQL запрос идет по хранимому столбцу search_vector с
+    GIN-индексом, на остальных СУБД — по RecipeIndex. В обоих случаях
+    рецепты получают аннотацию rank и сортируются по ('-rank', '-id').
+    """
+
+    ttl_setting = 'RECIPE_SEARCH_TTL'
+
+    def build_index(self):
+        return RecipeIndex(
+            Recipe.objects.values_list('id', 'name', 'text').iterator(),
+            IngredientRecipe.objects.values_list(
+                'recipe_id', 'ingredient__name'
+            ).iterator(),
+        )
+
+    def get_vector(self):
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredients = Subquery(
+            IngredientRecipe.objects.filter(recipe=OuterRef('pk'))
+            .order_by().values('recipe')
+            .annotate(names=StringAgg('ingredient__name', ' '))
+            .values('names')
+        )
+        return (
+            SearchVector('name', weight='A', config=config)
+            + SearchVector(ingredients, weight='B', config=config)
+            + SearchVector('text', weight='C', config=config)
+        )
+
+    def refresh(self, recipe_ids=None):
+        """Пересчитывает search_vector рецептов после их изменения."""
+        if connection.vendor != 'postgresql':
+            self.invalidate()
+            return
+        queryset = Recipe.objects.all()
+        if recipe_ids is not None:
+            queryset = queryset.filter(pk__in=recipe_ids)
+        queryset.update(search_vector=self.get_vector())
+
+    def search(self, queryset, query):
+        query = query.strip()
+        if not query:
+            return queryset
+        if connection.vendor == 'postgresql':
+            search_query = SearchQuery(
+                query, config=settings.RECIPE_SEARCH_CONFIG
+            )
+            return queryset.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F('search_vector'), search_query),
+            ).order_by('-rank', '-id')
+        by_score = defaultdict(list)
+        for recipe_id, score in self.get_index().search(query).items():
+            by_score[score].append(recipe_id)
+        return queryset.filter(
+            pk__in=[pk for ids in by_score.values() for pk in ids]
+        ).annotate(rank=Case(
+            *[
+                When(pk__in=ids, then=Value(float(score)))
+                for score, ids in by_score.items()
+            ],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )).order_by('-rank', '-id')
+
+
+ingredient_search = IngredientSearch()
+recipe_search = RecipeSearch()
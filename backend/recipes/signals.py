@@ -0,0 +1,119 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from users.models import User
+
+from .counters import (COUNTERS, RECIPE_CARTS, RECIPE_FAVORITES,
+                       USER_SUBSCRIBERS, counter_receiver, parent_pks,
+                       recount)
+from .matching import recipe_matcher
+from .models import (Ingredient, IngredientRecipe, Recipe,
+                     ShoppingCartIngredient)
+from .search import ingredient_search, recipe_search
+
+# Индексы, которые нельзя описать переносимо в Meta моделей.
+POSTGRES_EXTENSIONS = ('pg_trgm',)
+POSTGRES_INDEXES = (
+    (
+        'recipes_ingredient_name_trgm',
+        'recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+    ),
+    (
+        'recipes_recipe_search_vector',
+        'recipes_recipe USING gin (search_vector)',
+    ),
+)
+
+
+def create_postgres_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for extension in POSTGRES_EXTENSIONS:
+            cursor.execute(f'CREATE EXTENSION IF NOT EXISTS {extension}')
+        for name, definition in POSTGRES_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {definition}'
+            )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_search(**kwargs):
+    ingredient_search.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_recipes(instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        recipe_search.refresh(
+            instance.recipe.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_search(**kwargs):
+    recipe_search.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, raw=False, **kwargs):
+    if not raw:
+        recipe_matcher.changed([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(instance, raw=False, **kwargs):
+    if not raw:
+        recipe_matcher.changed([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        recipe_matcher.changed((pk_set or ()) if reverse else [instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(instance, **kwargs):
+    ShoppingCartIngredient.objects.change_recipe(
+        instance,
+        dict(instance.ingredient.values_list('ingredient_id', 'amount')),
+        {},
+    )
+
+
+for counter in COUNTERS:
+    post_save.connect(
+        counter_receiver(counter), sender=counter.related, weak=False,
+        dispatch_uid=f'{counter.model.__name__}.{counter.field}',
+    )
+
+# Счетчики, которые меняет каскадное удаление пользователя: чужие
+# рецепты в его избранном и корзине и авторы, на которых он подписан.
+USER_CASCADE_COUNTERS = (
+    (RECIPE_FAVORITES, 'favorites'),
+    (RECIPE_CARTS, 'shopping_cart'),
+    (USER_SUBSCRIBERS, 'subscriber'),
+)
+
+
+@receiver(pre_delete, sender=User)
+def collect_user_counters(instance, **kwargs):
+    instance.counted_parents = [
+        (counter, parent_pks(counter, getattr(instance, related).all()))
+        for counter, related in USER_CASCADE_COUNTERS
+    ]
+
+
+@receiver(post_delete, sender=User)
+def recount_user_counters(instance, **kwargs):
+    """Один UPDATE на счетчик после удаления всех строк каскада."""
+    for counter, pks in getattr(instance, 'counted_parents', ()):
+        if pks:
+            recount(counter, pks)
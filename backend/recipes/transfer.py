@@ -0,0 +1,473 @@
+import csv
+import json
+import multiprocessing
+import sys
+from contextlib import nullcontext
+from collections import defaultdict, namedtuple
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.files import File
+from django.db import connection, connections, transaction
+
+from users.models import User
+
+from .counters import USER_RECIPES, recount
+from .matching import recipe_matcher
+from .models import (Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+                     ShoppingCartIngredient, Tag)
+from .search import recipe_search
+
+FORMATS = ('csv', 'json', 'ndjson')
+
+# Итог загрузки пачки; из дочерних процессов возвращается только он.
+# variant_images — изображения, для которых родительский процесс ставит
+# в очередь уменьшенные копии: пул дочерних процессов завершается
+# terminate() и потерял бы их фоновые задачи.
+BatchResult = namedtuple(
+    'BatchResult',
+    'processed created updated missing_images cache_tags variant_images',
+)
+
+
+def detect_format(path, default='ndjson'):
+    suffix = Path(path).suffix.lstrip('.').lower()
+    return suffix if suffix in FORMATS else default
+
+
+def open_file(path, mode='r'):
+    """Файл для чтения или записи; "-" — стандартный ввод или вывод."""
+    if path == '-':
+        return nullcontext(sys.stdout if 'w' in mode else sys.stdin)
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_rows(file, format):
+    """Записи из файла; csv и ndjson читаются построчно."""
+    if format == 'csv':
+        yield from csv.DictReader(file)
+    elif format == 'json':
+        yield from json.load(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def import_rows(transfer, rows, batch_size, workers=1):
+    """
+    Загружает записи пачками и по мере загрузки отдает их счетчики.
+
+    При workers > 1 пачки обрабатываются в дочерних процессах, у каждого
+    свое соединение с базой; в очереди не больше двух пачек на процесс.
+    """
+    batches = batched(rows, batch_size)
+    if workers <= 1:
+        for batch in batches:
+            yield transfer.import_batch(batch)
+        return
+    connections.close_all()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        for window in batched(batches, workers * 2):
+            yield from pool.imap_unordered(transfer.import_batch, window)
+
+
+class RowWriter:
+    """Потоковая запись словарей в csv, json или ndjson."""
+
+    def __init__(self, file, format, fields):
+        self.file = file
+        self.format = format
+        self.separator = '['
+        if format == 'csv':
+            self.writer = csv.DictWriter(
+                file, fieldnames=fields, lineterminator='\n'
+            )
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.format == 'csv':
+            self.writer.writerow({
+                field: json.dumps(value, ensure_ascii=False)
+                if isinstance(value, (list, dict)) else value
+                for field, value in row.items()
+            })
+            return
+        line = json.dumps(row, ensure_ascii=False)
+        if self.format == 'json':
+            self.file.write(f'{self.separator}\n{line}')
+            self.separator = ','
+        else:
+            self.file.write(f'{line}\n')
+
+    def close(self):
+        if self.format == 'json':
+            self.file.write('[]\n' if self.separator == '[' else '\n]\n')
+
+
+class Transfer:
+    """
+    Импорт и экспорт записей модели по естественному ключу.
+
+    Пачка записей загружается одним запросом существующих строк, новые
+    строки создаются через bulk_create(ignore_conflicts=True), а
+    существующие при update=True обновляются через bulk_update.
+    """
+
+    model = None
+    key = ()
+    fields = ()
+    update_fields = ()
+    nested = ()
+
+    def __init__(self, update=False, images=None):
+        self.update = update
+        self.images = images and Path(images)
+        self.missing_images = 0
+
+    def export_rows(self, batch_size):
+        return self.model.objects.order_by('pk').values(
+            *self.fields
+        ).iterator(chunk_size=batch_size)
+
+    def prepare(self, rows):
+        """Загружает объекты, на которые ссылаются записи пачки."""
+
+    def clean(self, row):
+        """Значения полей модели для записи файла."""
+        return {field: row[field] for field in self.fields}
+
+    def parse(self, row):
+        for field in self.nested:
+            if isinstance(row.get(field), str):
+                row[field] = json.loads(row[field] or '[]')
+        return row
+
+    def get_key(self, values):
+        return tuple(values[field] for field in self.key)
+
+    def get_existing(self, keys):
+        queryset = self.model.objects.filter(**{
+            f'{field}__in': {key[position] for key in keys}
+            for position, field in enumerate(self.key)
+        })
+        existing = {}
+        for obj in queryset:
+            key = tuple(getattr(obj, field) for field in self.key)
+            if key in keys:
+                existing[key] = obj
+        return existing
+
+    def import_batch(self, rows):
+        """Загружает пачку и возвращает BatchResult."""
+        missing_images = self.missing_images
+        self.variant_images = set()
+        rows = [self.parse(row) for row in rows]
+        self.prepare(rows)
+        records = {}
+        for row in rows:
+            values = self.clean(row)
+            records[self.get_key(values)] = values
+        with transaction.atomic():
+            self.lock(records)
+            existing = self.get_existing(records)
+            created = [
+                key for key in records if key not in existing
+            ]
+            self.model.objects.bulk_create(
+                [self.model(**self.model_values(records[key]))
+                 for key in created],
+                ignore_conflicts=True,
+            )
+            updated = []
+            if self.update and self.update_fields:
+                for key, obj in existing.items():
+                    for field in self.update_fields:
+                        setattr(obj, field, records[key][field])
+                    updated.append(obj)
+                self.model.objects.bulk_update(updated, self.update_fields)
+            self.save_related(records, created, existing)
+        return BatchResult(
+            len(rows), len(created), len(updated),
+            self.missing_images - missing_images,
+            self.cache_tags(created, updated), self.variant_images,
+        )
+
+    def lock(self, keys):
+        """Блокирует ключи пачки до конца транзакции."""
+
+    def cache_tags(self, created, updated):
+        """Теги кеша ответов, устаревших после загрузки пачки."""
+        return set()
+
+    def model_values(self, values):
+        return values
+
+    def save_related(self, records, created, existing):
+        """Сохраняет связанные строки после записи пачки."""
+
+
+class IngredientTransfer(Transfer):
+    model = Ingredient
+    key = fields = ('name', 'measurement_unit')
+
+
+class TagTransfer(Transfer):
+    model = Tag
+    key = ('slug',)
+    fields = ('name', 'slug', 'color')
+    update_fields = ('name', 'color')
+
+
+class UserTransfer(Transfer):
+    """Пароль переносится хешем; открытый пароль будет захеширован."""
+
+    model = User
+    key = ('username',)
+    fields = ('username', 'email', 'first_name', 'last_name', 'password')
+    update_fields = ('email', 'first_name', 'last_name', 'password')
+
+    def clean(self, row):
+        values = super().clean(row)
+        try:
+            identify_hasher(values['password'])
+        except ValueError:
+            values['password'] = make_password(values['password'] or None)
+        return values
+
+    def cache_tags(self, created, updated):
+        return {f'user:{user.pk}' for user in updated}
+
+
+class RecipeTransfer(Transfer):
+    """
+    Рецепт с автором (username), тегами (slug) и ингредиентами.
+
+    В csv теги и ингредиенты хранятся строкой JSON. Если указан каталог
+    images, файлы изображений копируются в него при экспорте и из него
+    в хранилище при импорте. Уникального ограничения на автора и
+    название нет, поэтому параллельные процессы загружают рецепты одного
+    автора по очереди.
+    """
+
+    model = Recipe
+    key = ('author_id', 'name')
+    fields = (
+        'author', 'name', 'text', 'cooking_time', 'image',
+        'tags', 'ingredients',
+    )
+    update_fields = ('text', 'cooking_time', 'image')
+    nested = ('tags', 'ingredients')
+
+    @property
+    def storage(self):
+        return Recipe._meta.get_field('image').storage
+
+    def export_rows(self, batch_size):
+        last_id = 0
+        while True:
+            recipes = list(Recipe.objects.filter(id__gt=last_id).order_by(
+                'id'
+            ).values(
+                'id', 'name', 'text', 'cooking_time', 'image',
+                'author__username',
+            )[:batch_size])
+            if not recipes:
+                return
+            ids = [recipe['id'] for recipe in recipes]
+            tags = defaultdict(list)
+            for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=ids
+            ).order_by('tag__slug').values_list('recipe_id', 'tag__slug'):
+                tags[recipe_id].append(slug)
+            ingredients = defaultdict(list)
+            for row in IngredientRecipe.objects.filter(
+                recipe_id__in=ids
+            ).order_by('id').values(
+                'recipe_id', 'amount',
+                'ingredient__name', 'ingredient__measurement_unit',
+            ):
+                ingredients[row['recipe_id']].append({
+                    'name': row['ingredient__name'],
+                    'measurement_unit': row['ingredient__measurement_unit'],
+                    'amount': row['amount'],
+                })
+            for recipe in recipes:
+                if self.images and recipe['image']:
+                    self.export_image(recipe['image'])
+                yield {
+                    'author': recipe['author__username'],
+                    'name': recipe['name'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'image': recipe['image'],
+                    'tags': tags[recipe['id']],
+                    'ingredients': ingredients[recipe['id']],
+                }
+            last_id = ids[-1]
+
+    def export_image(self, name):
+        target = self.images / name
+        if target.exists():
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with self.storage.open(name) as source:
+                target.write_bytes(source.read())
+        except FileNotFoundError:
+            self.missing_images += 1
+
+    def import_image(self, name):
+        if not self.images or not name or self.storage.exists(name):
+            return name
+        try:
+            with open(self.images / name, 'rb') as source:
+                # store() вместо save(): варианты ставятся в очередь
+                # по variant_images, а не в процессе загрузки.
+                content = File(source)
+                return self.storage.store(
+                    self.storage.hashed_name(name, content), content
+                )
+        except FileNotFoundError:
+            self.missing_images += 1
+            return name
+
+    def prepare(self, rows):
+        self.authors = dict(User.objects.filter(
+            username__in={row['author'] for row in rows}
+        ).values_list('username', 'id'))
+        self.tags = dict(Tag.objects.filter(
+            slug__in={slug for row in rows for slug in row['tags']}
+        ).values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): ingredient_id
+            for ingredient_id, name, unit in Ingredient.objects.filter(
+                name__in={
+                    item['name'] for row in rows
+                    for item in row['ingredients']
+                }
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+
+    def clean(self, row):
+        try:
+            return {
+                'author_id': self.authors[row['author']],
+                'name': row['name'],
+                'text': row['text'],
+                'cooking_time': int(row['cooking_time']),
+                'image': self.import_image(row['image']),
+                'tags': [self.tags[slug] for slug in row['tags']],
+                'ingredients': {
+                    self.ingredients[
+                        item['name'], item['measurement_unit']
+                    ]: int(item['amount'])
+                    for item in row['ingredients']
+                },
+            }
+        except KeyError as error:
+            raise ValueError(
+                f'Рецепт "{row["name"]}": не найден объект {error}'
+            )
+
+    def lock(self, keys):
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(%s::regclass::oid::int, id) '
+                'FROM (SELECT DISTINCT unnest(%s::int[]) AS id '
+                'ORDER BY id) AS authors',
+                [Recipe._meta.db_table, [author_id for author_id, _ in keys]],
+            )
+
+    def cache_tags(self, created, updated):
+        if not created and not updated:
+            return set()
+        return {'recipes'} | {
+            f'user:{author_id}' for author_id, _ in created
+        } | {
+            tag for recipe in updated
+            for tag in (f'recipe:{recipe.pk}', f'user:{recipe.author_id}')
+        }
+
+    def model_values(self, values):
+        return {
+            field: value for field, value in values.items()
+            if field not in self.nested
+        }
+
+    def save_related(self, records, created, existing):
+        recipe_ids = {}
+        if created:
+            recipe_ids.update(
+                ((author_id, name), recipe_id)
+                for recipe_id, author_id, name in Recipe.objects.filter(
+                    author_id__in={key[0] for key in created},
+                    name__in={key[1] for key in created},
+                ).values_list('id', 'author_id', 'name')
+                if (author_id, name) in records
+                and (author_id, name) not in existing
+            )
+        updated_ids = []
+        if self.update:
+            for key, obj in existing.items():
+                recipe_ids[key] = obj.id
+                updated_ids.append(obj.id)
+        if created:
+            recount(USER_RECIPES, {author_id for author_id, _ in created})
+        if not recipe_ids:
+            return
+        self.variant_images.update(
+            records[key]['image'] for key in recipe_ids
+            if records[key]['image']
+        )
+        if updated_ids:
+            Recipe.tags.through.objects.filter(
+                recipe_id__in=updated_ids
+            ).delete()
+            IngredientRecipe.objects.filter(
+                recipe_id__in=updated_ids
+            ).delete()
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for key, recipe_id in recipe_ids.items()
+                for tag_id in records[key]['tags']
+            ],
+            ignore_conflicts=True,
+        )
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for key, recipe_id in recipe_ids.items()
+            for ingredient_id, amount in records[key]['ingredients'].items()
+        ])
+        recipe_search.refresh(list(recipe_ids.values()))
+        recipe_matcher.changed(recipe_ids.values())
+        if updated_ids:
+            user_ids = set(ShoppingCart.objects.filter(
+                recipe_id__in=updated_ids
+            ).values_list('user_id', flat=True))
+            if user_ids:
+                ShoppingCartIngredient.objects.rebuild(user_ids)
+
+
+TRANSFERS = {
+    'ingredients': IngredientTransfer,
+    'tags': TagTransfer,
+    'users': UserTransfer,
+    'recipes': RecipeTransfer,
+}
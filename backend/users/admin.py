@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from recipes.admin import CountedDeleteMixin
+from recipes.counters import USER_SUBSCRIBERS
+
 from .models import User, Subscribe
 
 
@@ -20,5 +23,6 @@ class UserAdmin(UserAdmin):
 
 
 @admin.register(Subscribe)
-class SubscribeAdmin(admin.ModelAdmin):
+class SubscribeAdmin(CountedDeleteMixin, admin.ModelAdmin):
+    counter = USER_SUBSCRIBERS
     list_display = ('user', 'author',)
@@ -59,6 +59,16 @@ class User(AbstractUser):
         blank=True,
         verbose_name="Код подтверждения",
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Число рецептов",
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Число подписчиков",
+    )
 
     class Meta:
         ordering = ('id', )
@@ -70,21 +80,31 @@ class Subscribe(models.Model):
         related_name='subscriber',
         verbose_name="Подписчик",
         on_delete=models.CASCADE,
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         related_name='subscribing',
         verbose_name="Пользователь",
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
         ordering = ('-id', )
+        # Подписки пользователя ищутся по unique_subscription,
+        # подписчики автора — по subscribe_author_user_idx.
         constraints = [
             UniqueConstraint(
                 fields=['user', 'author'],
                 name='unique_subscription',
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscribe_author_user_idx',
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -9,7 +10,11 @@ from rest_framework.response import Response
 
 from api.pagination import CustomLimitPagination
 from api.permissions import IsOwnerOrReadOnly
-from api.serializers import CustomUserSerializer, SubscribeSerializer
+from api.serializers import (CustomUserSerializer, SubscribeSerializer,
+                             get_recipes_limit)
+from recipes.counters import USER_SUBSCRIBERS, delete_counted
+from recipes.models import Recipe
+
 from .models import Subscribe
 
 User = get_user_model()
@@ -45,10 +50,11 @@ class CustomUserViewSet(UserViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            subscription = get_object_or_404(Subscribe,
-                                             user=user,
-                                             author=author)
-            subscription.delete()
+            if not delete_counted(
+                USER_SUBSCRIBERS, author.pk,
+                Subscribe.objects.filter(user=user, author=author),
+            ):
+                raise Http404
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -57,8 +63,16 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(subscribing__user=user)
+        limit = get_recipes_limit(request)
+        queryset = User.objects.filter(
+            subscribing__user=user
+        ).order_by('-id')
         pages = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.latest_by_author(
+            [author.id for author in pages], limit
+        )
+        for author in pages:
+            author.latest_recipes = recipes[author.id]
         serializer = SubscribeSerializer(
             pages,
             many=True,